@@ -22,6 +22,8 @@ class Config:
     # Ensure this matches the format expected by pymongo and the docker-compose setup
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017/adaptive_bi")
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "adaptive_bi")
+    # Async driver: "motor" (default) or "pymongo" for PyMongo's native asyncio client (PyMongo 4.9+)
+    MONGODB_ASYNC_DRIVER: str = os.getenv("MONGODB_ASYNC_DRIVER", "motor").lower()
 
     # JWT settings (if used for internal service communication)
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your_strong_jwt_secret")
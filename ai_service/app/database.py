@@ -1,3 +1,4 @@
+import inspect
 import motor.motor_asyncio
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
@@ -15,6 +16,31 @@ sync_client: Optional[MongoClient] = None
 sync_db: Optional[Any] = None  # Database object
 
 
+def _create_async_client(mongo_uri: str) -> Any:
+    """
+    Creates the async client. PyMongo's native asyncio client runs on the event loop
+    directly, without Motor's executor thread hop per operation; it is used when
+    selected and available, otherwise Motor.
+    """
+    if settings.MONGODB_ASYNC_DRIVER == "pymongo":
+        try:
+            from pymongo import AsyncMongoClient # PyMongo 4.9+
+            logger.info("Using PyMongo's native asyncio client.")
+            return AsyncMongoClient(mongo_uri)
+        except ImportError:
+            logger.warning("MONGODB_ASYNC_DRIVER=pymongo needs PyMongo 4.9+; falling back to Motor.")
+    return motor.motor_asyncio.AsyncIOMotorClient(mongo_uri)
+
+async def aggregate_cursor(collection: Any, pipeline: list, **kwargs) -> Any:
+    """
+    Starts an aggregation on either async driver: Motor returns the cursor directly,
+    PyMongo's asyncio client returns an awaitable that resolves to it.
+    """
+    cursor = collection.aggregate(pipeline, **kwargs)
+    if inspect.isawaitable(cursor):
+        cursor = await cursor
+    return cursor
+
 async def connect_to_mongo(): # Renamed from connect_to_database for consistency with main.py
     """
     Establishes an asynchronous connection to MongoDB.
@@ -23,7 +49,7 @@ async def connect_to_mongo(): # Renamed from connect_to_database for consistency
     try:
         mongo_uri = settings.MONGODB_URL
         logger.info(f"Attempting to connect to MongoDB at: {mongo_uri.split('@')[-1]}") # Log without credentials
-        client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri)
+        client = _create_async_client(mongo_uri)
         if client is not None:
             db = client[settings.DATABASE_NAME] # Get the database instance
         
@@ -38,13 +64,51 @@ async def connect_to_mongo(): # Renamed from connect_to_database for consistency
         logger.error(f"An unexpected error occurred during MongoDB connection: {e}", exc_info=True)
         raise
 
+# Indexes backing the per-user and date range reads (queries rely on the planner, not hints)
+TRANSACTIONS_USER_DATE_INDEX = 'userId_1_transactionDate_-1'
+ACTIVITIES_USER_TIMESTAMP_INDEX = 'userId_1_timestamp_-1'
+TRANSACTIONS_DATE_INDEX = 'transactionDate_-1'
+
+async def ensure_indexes():
+    """
+    Creates the indexes the hot read paths rely on. create_index is idempotent,
+    so this is safe to run on every startup.
+    """
+    if db is None:
+        logger.error("MongoDB database instance is not initialized. Call connect_to_mongo first.")
+        return
+    indexes = [
+        (db.transactions, [('userId', 1), ('transactionDate', -1)], {'name': TRANSACTIONS_USER_DATE_INDEX}),
+        (db.transactions, [('transactionDate', -1)], {'name': TRANSACTIONS_DATE_INDEX}),
+        (db.user_activities, [('userId', 1), ('timestamp', -1)], {'name': ACTIVITIES_USER_TIMESTAMP_INDEX}),
+        (db.user_activities, [('timestamp', -1)], {}),
+        # Carries the value fields too, so per-model feedback summaries are answered from the index alone
+        (db.feedback, [('modelName', 1), ('createdAt', -1), ('predictedValue', 1), ('actualValue', 1)], {}),
+        (db.feedback, [('createdAt', -1)], {}),
+    ]
+    # Each index is created on its own, so one failure (e.g. an existing index with the
+    # same keys under another name) does not skip the rest
+    failed = 0
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            failed += 1
+            logger.error(f"Failed to ensure MongoDB index {keys} on {collection.name}: {e}", exc_info=True)
+    if failed:
+        logger.warning(f"MongoDB indexes ensured with {failed} of {len(indexes)} failing.")
+    else:
+        logger.info("MongoDB indexes ensured.")
+
 async def close_mongo_connection(): # Renamed from close_database_connection
     """
     Closes the asynchronous MongoDB connection.
     """
     global client
     if client:
-        client.close()
+        closed = client.close()
+        if inspect.isawaitable(closed): # PyMongo's asyncio client closes asynchronously
+            await closed
         logger.info("MongoDB connection closed.")
 
 def get_database() -> Any:
@@ -9,7 +9,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 # Import existing core modules
 from app.config import settings # This refers to the app/config.py file for main settings
-from app.database import close_mongo_connection, connect_to_mongo, get_database
+from app.database import close_mongo_connection, connect_to_mongo, ensure_indexes, get_database
 from app.utils.logger import logger, log_memory_usage, force_memory_cleanup # Your custom logger with memory functions
 
 # Import existing Phase 3 API routes
@@ -170,6 +170,7 @@ async def lifespan(app: FastAPI):
     # 1. Connect to MongoDB
     await connect_to_mongo()
     logger.info("MongoDB connection established.")
+    await ensure_indexes()
     log_memory_usage("after MongoDB connection")
     
     db_client: Any = get_database()
@@ -244,6 +245,9 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down APScheduler...")
         app.state.scheduler.shutdown()
         logger.info("APScheduler shut down.")
+
+    if feedback_service_instance is not None:
+        await feedback_service_instance.close() # Flush buffered implicit feedback while Mongo is still connected
         
     await close_mongo_connection()
     logger.info("AI Service shut down complete.")
@@ -13,6 +13,9 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import warnings
+
+from app.utils.model_utils import dump_atomic
+
 warnings.filterwarnings('ignore')
 
 logging.basicConfig(level=logging.INFO)
@@ -72,17 +75,17 @@ class DynamicPricingModel:
         
         # Market features
         # Handle cases where sum might be zero
-        features['market_share'] = features.groupby('product_id')['quantity'].transform(
+        features['market_share'] = features.groupby('product_id', observed=True)['quantity'].transform(
             lambda x: x / (x.sum() + 1e-6)
         )
         # Handle cases where std might be zero - check if category column exists
         if 'category' in features.columns:
-            features['competitive_index'] = features.groupby('category')['price'].transform(
+            features['competitive_index'] = features.groupby('category', observed=True)['price'].transform(
                 lambda x: (x - x.mean()) / (x.std() + 1e-6)
             ).fillna(0)
         else:
             # Use product_id grouping as fallback if category doesn't exist
-            features['competitive_index'] = features.groupby('product_id')['price'].transform(
+            features['competitive_index'] = features.groupby('product_id', observed=True)['price'].transform(
                 lambda x: (x - x.mean()) / (x.std() + 1e-6)
             ).fillna(0)
             logger.info("Using product_id for competitive index calculation - 'category' column not found")
@@ -107,9 +110,9 @@ class DynamicPricingModel:
         features['stockout_risk'] = (stock_level_values < quantity_rolling_mean).astype(int)
         
         # Customer behavior features
-        features['customer_lifetime_value'] = features.groupby('user_id')['amount'].transform('sum')
-        features['avg_order_value'] = features.groupby('user_id')['amount'].transform('mean')
-        features['purchase_frequency'] = features.groupby('user_id')['user_id'].transform('count')
+        features['customer_lifetime_value'] = features.groupby('user_id', observed=True)['amount'].transform('sum')
+        features['avg_order_value'] = features.groupby('user_id', observed=True)['amount'].transform('mean')
+        features['purchase_frequency'] = features.groupby('user_id', observed=True)['user_id'].transform('count')
         
         # Seasonal features
         features['quarter'] = pd.to_datetime(features['timestamp']).dt.quarter
@@ -258,8 +261,8 @@ class DynamicPricingModel:
             logger.error(f"Error predicting optimal price: {str(e)}")
             return {'status': 'error', 'message': str(e)}
     
-    def save_model(self, path: str = 'models/saved_models/dynamic_pricing_model.pkl'):
-        """Save the trained model."""
+    def save_model(self, path: str = 'models/saved_models/dynamic_pricing_model.pkl', compress: int = 3):
+        """Save the trained model (joblib compression level `compress`, atomic writes)."""
         if self.is_trained:
             model_data = {
                 'model': self.model,
@@ -267,7 +270,7 @@ class DynamicPricingModel:
                 'feature_columns': self.feature_columns,
                 'is_trained': self.is_trained
             }
-            joblib.dump(model_data, path)
+            dump_atomic(model_data, path, compress=compress)
             logger.info(f"Pricing model saved to {path}")
     
     def load_model(self, path: str = 'models/saved_models/dynamic_pricing_model.pkl'):
@@ -295,9 +298,14 @@ class ChurnPredictionModel:
         self.is_trained = False
         self.feature_importance = {}
     
-    def prepare_features(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Prepare comprehensive features for churn prediction."""
+    def prepare_features(self, data: pd.DataFrame, reference_date: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Prepare comprehensive features for churn prediction.
+        reference_date is the caller's "now" snapshot, used wherever the data gives no time reference.
+        """
         features = data.copy()
+        if reference_date is None:
+            reference_date = datetime.now()
         
         # Debug: Log what columns we have
         logger.info(f"Churn model received data with columns: {list(features.columns)}")
@@ -307,7 +315,7 @@ class ChurnPredictionModel:
         for col in required_cols:
             if col not in features.columns:
                 if col == 'timestamp':
-                    features[col] = datetime.now() # Use current time as fallback
+                    features[col] = reference_date # Use current time as fallback
                 elif col == 'amount':
                     features[col] = 0.0
                 elif col == 'user_id':
@@ -334,28 +342,24 @@ class ChurnPredictionModel:
         # Calculate current_date based on max timestamp in the actual data to avoid future dates
         current_date = features['timestamp'].max()
         if pd.isna(current_date): # Handle case where max() is NaN if all timestamps were NaT
-            current_date = datetime.now()
+            current_date = reference_date
 
-        customer_metrics = features.groupby('user_id').agg(
-            recency_days=('timestamp', lambda x: (current_date - pd.to_datetime(x).max()).days),  # Recency
+        # One grouping pass with built-in (cythonized) reductions only; the first/last
+        # timestamps are reduced per user and the day differences are taken afterwards
+        # on the small per-user frame instead of via a Python lambda per group.
+        user_groups = features.groupby('user_id')
+        user_aggregates = user_groups.agg(
+            first_seen=('timestamp', 'min'),
+            last_seen=('timestamp', 'max'),
             frequency=('transaction_id', 'count'),  # Frequency
             total_spent=('amount', 'sum'),  # Monetary Sum
             avg_order_value=('amount', 'mean'),  # Monetary Mean
-            spending_volatility=('amount', 'std')  # Monetary Std
+            spending_volatility=('amount', 'std'),  # Monetary Std
+            product_diversity=('product_id', 'nunique')  # Product diversity
         ).reset_index()
-        
-        customer_metrics['spending_volatility'] = customer_metrics['spending_volatility'].fillna(0)
-        
-        # Behavioral features - handle missing category gracefully  
+
         logger.info(f"Preparing behavioral features, columns available: {list(features.columns)}")
-        behavior_features = features.groupby('user_id').agg({
-            'product_id': lambda x: x.nunique(),  # Product diversity
-            'timestamp': lambda x: (pd.to_datetime(x).max() - pd.to_datetime(x).min()).days  # Customer lifetime
-        }).reset_index()
-        
-        # Rename columns
-        behavior_features.columns = ['user_id', 'product_diversity', 'customer_lifetime_days']
-        
+
         # Add category diversity if category column has meaningful data
         has_category = 'category' in features.columns
         category_unique_count = features['category'].nunique() if has_category else 0
@@ -363,9 +367,65 @@ class ChurnPredictionModel:
         
         logger.info(f"Checking category column: exists={has_category}, unique_values={category_unique_count}, meaningful={has_meaningful_categories}")
         
+        category_diversity = user_groups['category'].nunique() if has_meaningful_categories else None
+
+        return self._build_customer_features(user_aggregates, current_date, category_diversity)
+
+    def prepare_features_from_aggregates(self, user_aggregates: pd.DataFrame,
+                                         reference_date: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Prepare churn features from per-user interaction aggregates computed
+        elsewhere (e.g. a MongoDB $group), one row per user with columns
+        user_id, first_seen, last_seen, frequency, total_spent, avg_order_value,
+        spending_volatility, product_diversity and categories (list of the
+        user's distinct categories). Produces the same frame as prepare_features
+        on the underlying interactions; reference_date is likewise the recency
+        fallback when no user has a last_seen date.
+        """
+        if user_aggregates.empty:
+            logger.warning("No per-user aggregates to prepare churn features from.")
+            return pd.DataFrame()
+
+        user_aggregates = user_aggregates.sort_values('user_id').reset_index(drop=True)
+        user_aggregates['first_seen'] = pd.to_datetime(user_aggregates['first_seen'])
+        user_aggregates['last_seen'] = pd.to_datetime(user_aggregates['last_seen'])
+        current_date = user_aggregates['last_seen'].max()
+        if pd.isna(current_date): # Handle case where every last_seen is NaT
+            current_date = reference_date if reference_date is not None else datetime.now()
+
+        all_categories = {category for categories in user_aggregates['categories'] for category in categories}
+        has_meaningful_categories = (
+            len(all_categories) > 1 and not all('unknown' in str(category) for category in all_categories)
+        )
+        logger.info(f"Checking aggregated categories: unique_values={len(all_categories)}, meaningful={has_meaningful_categories}")
+
+        category_diversity = None
         if has_meaningful_categories:
+            category_diversity = pd.Series(
+                user_aggregates['categories'].map(len).to_numpy(), index=user_aggregates['user_id']
+            )
+        return self._build_customer_features(user_aggregates, current_date, category_diversity)
+
+    def _build_customer_features(self, user_aggregates: pd.DataFrame, current_date,
+                                 category_diversity: Optional[pd.Series]) -> pd.DataFrame:
+        """
+        Derives the churn feature frame from per-user aggregates. category_diversity
+        is a per-user count indexed by user_id, or None to default every user to 1.
+        """
+        customer_metrics = user_aggregates[['user_id']].copy()
+        customer_metrics['recency_days'] = (current_date - user_aggregates['last_seen']).dt.days  # Recency
+        customer_metrics[['frequency', 'total_spent', 'avg_order_value', 'spending_volatility']] = \
+            user_aggregates[['frequency', 'total_spent', 'avg_order_value', 'spending_volatility']]
+        
+        customer_metrics['spending_volatility'] = customer_metrics['spending_volatility'].fillna(0)
+        
+        # Behavioral features - handle missing category gracefully  
+        behavior_features = user_aggregates[['user_id', 'product_diversity']].copy()
+        behavior_features['customer_lifetime_days'] = (user_aggregates['last_seen'] - user_aggregates['first_seen']).dt.days  # Customer lifetime
+        
+        if category_diversity is not None:
             logger.info("Adding category diversity from actual category data")
-            category_diversity = features.groupby('user_id')['category'].nunique().reset_index()
+            category_diversity = category_diversity.reset_index()
             category_diversity.columns = ['user_id', 'category_diversity']
             behavior_features = behavior_features.merge(category_diversity, on='user_id', how='left')
         else:
@@ -752,8 +812,8 @@ class ChurnPredictionModel:
             logger.error(f"Error predicting churn: {str(e)}")
             return {'status': 'error', 'message': str(e)}
     
-    def save_model(self, path: str = 'models/saved_models/churn_model.pkl'):
-        """Save the trained model."""
+    def save_model(self, path: str = 'models/saved_models/churn_model.pkl', compress: int = 3):
+        """Save the trained model (joblib compression level `compress`, atomic writes)."""
         if self.is_trained:
             model_data = {
                 'model': self.model,
@@ -762,7 +822,7 @@ class ChurnPredictionModel:
                 'feature_importance': self.feature_importance,
                 'is_trained': self.is_trained
             }
-            joblib.dump(model_data, path)
+            dump_atomic(model_data, path, compress=compress)
             logger.info(f"Churn model saved to {path}")
     
     def load_model(self, path: str = 'models/saved_models/churn_model.pkl'):
@@ -5,6 +5,7 @@ import joblib
 import os
 from app.config import settings
 from app.utils.logger import logger
+from app.utils.model_utils import dump_atomic
 from app.services.feature_engineering import FeatureEngineer
 
 class AnomalyDetectionModel:
@@ -147,15 +148,15 @@ class AnomalyDetectionModel:
             details.append(detail)
         return details
 
-    def save_model(self):
-        """Saves the trained model and its feature engineer."""
+    def save_model(self, compress: int = 3):
+        """Saves the trained model and its feature engineer (joblib compression level `compress`, atomic writes)."""
         if self.model:
             os.makedirs(settings.MODEL_SAVE_PATH, exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.feature_engineer, os.path.join(settings.MODEL_SAVE_PATH, f"anomaly_feature_engineer_{self.model_type}.joblib"))
+            dump_atomic(self.model, self.model_path, compress=compress)
+            dump_atomic(self.feature_engineer, os.path.join(settings.MODEL_SAVE_PATH, f"anomaly_feature_engineer_{self.model_type}.joblib"), compress=compress)
             # Also save the list of trained features
             if hasattr(self, '_trained_features'):
-                joblib.dump(self._trained_features, os.path.join(settings.MODEL_SAVE_PATH, f"anomaly_trained_features_{self.model_type}.joblib"))
+                dump_atomic(self._trained_features, os.path.join(settings.MODEL_SAVE_PATH, f"anomaly_trained_features_{self.model_type}.joblib"), compress=compress)
             logger.info(f"Anomaly detection model and feature engineer saved to {self.model_path}")
         else:
             logger.warning("No anomaly detection model to save.")
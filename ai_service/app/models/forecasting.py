@@ -8,6 +8,7 @@ import joblib
 import os
 from app.config import settings
 from app.utils.logger import logger
+from app.utils.model_utils import dump_atomic
 from app.services.feature_engineering import FeatureEngineer
 
 class ForecastingModel:
@@ -201,13 +202,13 @@ class ForecastingModel:
         return forecast_df[['timestamp', target_col]]
 
 
-    def save_model(self):
-        """Saves the trained model and feature engineer (scalers/encoders) and trained features."""
+    def save_model(self, compress: int = 3):
+        """Saves the trained model and feature engineer (scalers/encoders) and trained features (joblib compression level `compress`, atomic writes)."""
         if self.model:
             os.makedirs(settings.MODEL_SAVE_PATH, exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.feature_engineer, os.path.join(settings.MODEL_SAVE_PATH, f"forecasting_feature_engineer_{self.model_type}.joblib"))
-            joblib.dump(self._trained_features, os.path.join(settings.MODEL_SAVE_PATH, f"forecasting_trained_features_{self.model_type}.joblib"))
+            dump_atomic(self.model, self.model_path, compress=compress)
+            dump_atomic(self.feature_engineer, os.path.join(settings.MODEL_SAVE_PATH, f"forecasting_feature_engineer_{self.model_type}.joblib"), compress=compress)
+            dump_atomic(self._trained_features, os.path.join(settings.MODEL_SAVE_PATH, f"forecasting_trained_features_{self.model_type}.joblib"), compress=compress)
             logger.info(f"Forecasting model, feature engineer, and trained features saved to {self.model_path}")
         else:
             logger.warning("No forecasting model to save.")
@@ -620,7 +620,15 @@ class CustomerBehaviorGraph:
                 for attr_key, value in list(data.items()):
                     data[attr_key] = convert_to_string(value)
             
-            nx.write_gml(graph_copy, path)
+            # Written next to the target and renamed into place, so an interrupted save
+            # never leaves a truncated graph file behind
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                nx.write_gml(graph_copy, tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
             logger.info(f"Knowledge graph saved to {path}")
             return {'status': 'success', 'path': path}
         except Exception as e:
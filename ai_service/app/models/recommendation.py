@@ -7,6 +7,7 @@ import os
 from typing import Optional
 from app.config import settings
 from app.utils.logger import logger
+from app.utils.model_utils import dump_atomic
 from app.services.data_processor import DataProcessor
 
 class RecommendationModel:
@@ -18,6 +19,7 @@ class RecommendationModel:
         self.model_type = model_type
         self.n_components = n_components
         self.user_item_matrix = None # Stores the user-item interaction matrix
+        self.sparse_user_item = None # CSR form of user_item_matrix, built once after train/load
         self.user_mapper = {} # Map original user IDs to matrix indices
         self.item_mapper = {} # Map original item IDs to matrix indices
         self.user_inverse_mapper = {} # Map matrix indices back to original user IDs
@@ -46,8 +48,9 @@ class RecommendationModel:
         self.user_inverse_mapper = {idx: user_id for user_id, idx in self.user_mapper.items()}
         self.item_inverse_mapper = {idx: item_id for item_id, idx in self.item_mapper.items()}
 
-        # Convert to sparse matrix for SVD
-        sparse_user_item = csr_matrix(self.user_item_matrix.values)
+        # DataProcessor hands over a sparse-backed frame; take its CSR form directly
+        # rather than densifying it first, and keep it for scoring
+        sparse_user_item = self.sparse_user_item = self._to_csr(self.user_item_matrix)
 
         if self.model_type == "SVD":
             # Adjust n_components based on matrix dimensions to avoid errors
@@ -88,6 +91,16 @@ class RecommendationModel:
             logger.error(f"Error during recommendation model training: {e}")
             return {"status": "failed", "message": f"Training error: {str(e)}"}
 
+    @staticmethod
+    def _to_csr(user_item_matrix: pd.DataFrame) -> csr_matrix:
+        """
+        CSR form of the user-item matrix. Sparse-backed frames convert without densifying;
+        matrices saved as dense frames (before the sparse DataProcessor output) still load.
+        """
+        if all(isinstance(dtype, pd.SparseDtype) for dtype in user_item_matrix.dtypes):
+            return user_item_matrix.sparse.to_coo().tocsr()
+        return csr_matrix(user_item_matrix.to_numpy(dtype=np.float64))
+
     def _get_popular_recommendations(self, num_recommendations: int = 10, product_data: Optional[pd.DataFrame] = None):
         """
         Provides general popular recommendations (e.g., for cold-start users).
@@ -120,30 +133,21 @@ class RecommendationModel:
             return self._get_popular_recommendations(num_recommendations, product_data)
 
         user_idx = self.user_mapper[user_id]
-        user_vector = self.user_item_matrix.iloc[user_idx]
 
-        # Reconstruct the original matrix from SVD components (approximation)
+        # Score only this user's row: project it onto the SVD components and back,
+        # instead of reconstructing the whole user-item matrix
         if self.model_type == "SVD":
-            reconstructed_matrix = np.dot(self.model.transform(csr_matrix(self.user_item_matrix.values)), self.model.components_)
-            # Convert back to DataFrame for easy indexing
-            reconstructed_df = pd.DataFrame(reconstructed_matrix, index=self.user_item_matrix.index, columns=self.user_item_matrix.columns)
-            
-            # Get predicted ratings for the user
-            user_predicted_ratings = reconstructed_df.loc[user_id]
+            user_row = self.sparse_user_item[user_idx]
+            user_predicted_ratings = (self.model.transform(user_row) @ self.model.components_)[0]
 
             # Filter out items the user has already interacted with
-            user_interacted_items = user_vector[user_vector > 0].index
-            recommendations_series = user_predicted_ratings.drop(user_interacted_items, errors='ignore')
+            interacted = np.zeros(user_row.shape[1], dtype=bool)
+            interacted[user_row.indices[user_row.data > 0]] = True
+            candidates = np.flatnonzero(~interacted)
 
             # Sort and get top N recommendations
-            if isinstance(recommendations_series, pd.Series):
-                top_recommendations = recommendations_series.sort_values(ascending=False).head(num_recommendations).index.tolist()
-            else:
-                # Convert to Series if not already
-                # If recommendations_series is a DataFrame, select the first row as a Series
-                if isinstance(recommendations_series, pd.DataFrame):
-                    recommendations_series = recommendations_series.iloc[0]
-                top_recommendations = recommendations_series.sort_values(ascending=False).head(num_recommendations).index.tolist()
+            ranked = candidates[np.argsort(-user_predicted_ratings[candidates], kind='stable')[:num_recommendations]]
+            top_recommendations = self.user_item_matrix.columns[ranked].tolist()
         else:
             logger.warning(f"Recommendation type {self.model_type} not fully implemented for prediction logic. Returning popular.")
             return self._get_popular_recommendations(num_recommendations, product_data)
@@ -164,16 +168,16 @@ class RecommendationModel:
         return [{"productId": pid} for pid in top_recommendations]
 
 
-    def save_model(self):
-        """Saves the trained model, user-item matrix, and mappers."""
+    def save_model(self, compress: int = 3):
+        """Saves the trained model, user-item matrix, and mappers (joblib compression level `compress`, atomic writes)."""
         if self.model:
             os.makedirs(settings.MODEL_SAVE_PATH, exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.user_item_matrix, os.path.join(settings.MODEL_SAVE_PATH, "user_item_matrix.joblib"))
-            joblib.dump(self.user_mapper, os.path.join(settings.MODEL_SAVE_PATH, "user_mapper.joblib"))
-            joblib.dump(self.item_mapper, os.path.join(settings.MODEL_SAVE_PATH, "item_mapper.joblib"))
-            joblib.dump(self.user_inverse_mapper, os.path.join(settings.MODEL_SAVE_PATH, "user_inverse_mapper.joblib"))
-            joblib.dump(self.item_inverse_mapper, os.path.join(settings.MODEL_SAVE_PATH, "item_inverse_mapper.joblib"))
+            dump_atomic(self.model, self.model_path, compress=compress)
+            dump_atomic(self.user_item_matrix, os.path.join(settings.MODEL_SAVE_PATH, "user_item_matrix.joblib"), compress=compress)
+            dump_atomic(self.user_mapper, os.path.join(settings.MODEL_SAVE_PATH, "user_mapper.joblib"), compress=compress)
+            dump_atomic(self.item_mapper, os.path.join(settings.MODEL_SAVE_PATH, "item_mapper.joblib"), compress=compress)
+            dump_atomic(self.user_inverse_mapper, os.path.join(settings.MODEL_SAVE_PATH, "user_inverse_mapper.joblib"), compress=compress)
+            dump_atomic(self.item_inverse_mapper, os.path.join(settings.MODEL_SAVE_PATH, "item_inverse_mapper.joblib"), compress=compress)
             logger.info(f"Recommendation model and associated data saved to {self.model_path}")
         else:
             logger.warning("No recommendation model to save.")
@@ -183,6 +187,7 @@ class RecommendationModel:
         try:
             self.model = joblib.load(self.model_path)
             self.user_item_matrix = joblib.load(os.path.join(settings.MODEL_SAVE_PATH, "user_item_matrix.joblib"))
+            self.sparse_user_item = self._to_csr(self.user_item_matrix)
             self.user_mapper = joblib.load(os.path.join(settings.MODEL_SAVE_PATH, "user_mapper.joblib"))
             self.item_mapper = joblib.load(os.path.join(settings.MODEL_SAVE_PATH, "item_mapper.joblib"))
             self.user_inverse_mapper = joblib.load(os.path.join(settings.MODEL_SAVE_PATH, "user_inverse_mapper.joblib"))
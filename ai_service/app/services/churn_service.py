@@ -6,7 +6,6 @@ Handles customer churn prediction, risk assessment, and retention strategies
 import logging
 import asyncio
 import os
-import gc  # Add garbage collection for memory management
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import numpy as np
@@ -16,6 +15,7 @@ from operator import attrgetter
 from app.models.advanced_models import ChurnPredictionModel
 from app.models.explainable_ai import ExplainableAI
 from app.model_configs.model_config import CHURN_CONFIG # Import the config instance instead
+from app.services.data_prep_utils import prepare_churn_features
 # from app.utils.feature_engineering import AdvancedFeatureProcessor # Not directly used here, churn_model handles features
 
 logger = logging.getLogger(__name__)
@@ -28,6 +28,7 @@ class ChurnService:
         self.config = CHURN_CONFIG # Use the pre-configured instance
         self._model_trained = False
         self.last_trained_time: Optional[datetime] = None # To track last training time
+        self._run_ts: Optional[datetime] = None # "now" snapshot shared by one training/prediction run
 
     async def initialize(self):
         """Initialize churn service and train/load model."""
@@ -38,8 +39,15 @@ class ChurnService:
             logger.error(f"Failed to initialize churn service: {e}")
             raise
 
+    def _get_run_ts(self) -> datetime:
+        """Returns the per-run "now" snapshot, taking it on first use."""
+        if self._run_ts is None:
+            self._run_ts = datetime.utcnow()  # Same clock as DataProcessor: naive UTC, as PyMongo returns BSON dates
+        return self._run_ts
+
     async def _load_and_train_model(self):
         """Load data and train churn prediction model."""
+        self._run_ts = None # New run, new "now"
         try:
             # Fetch limited data for training to prevent memory issues
             users_df = await self._get_user_data(limit=1000)  # Limit to 1000 users
@@ -102,6 +110,7 @@ class ChurnService:
         self, user_id: str, explain: bool = True
     ) -> Dict[str, Any]:
         """Predict churn probability for a specific user."""
+        self._run_ts = None # New run, new "now"
         if not self._model_trained:
             # Attempt to load from disk if not trained in current session (e.g., app restart)
             model_load_path = os.path.join(self.config.BASE_MODEL_DIR, f"{self.churn_model.model.__class__.__name__}_churn_model.joblib")
@@ -476,13 +485,11 @@ class ChurnService:
     async def _get_user_data(self, limit: Optional[int] = None) -> pd.DataFrame:
         """Fetches user data from MongoDB."""
         try:
-            users_cursor = self.db.users.find({})
+            users_cursor = self.db.users.find({}, {'_id': 0})
             if limit:
                 users_cursor = users_cursor.limit(limit)
             users_list = await users_cursor.to_list(length=None)
             df = pd.DataFrame(users_list)
-            if '_id' in df.columns:
-                df = df.drop(columns=['_id'])
             
             # Ensure datetime columns are correctly parsed
             df['registrationDate'] = pd.to_datetime(df['registrationDate'], errors='coerce')
@@ -497,13 +504,11 @@ class ChurnService:
     async def _get_transaction_data(self, limit: Optional[int] = None) -> pd.DataFrame:
         """Fetches transaction data from MongoDB."""
         try:
-            transactions_cursor = self.db.transactions.find({})
+            transactions_cursor = self.db.transactions.find({}, {'_id': 0})
             if limit:
                 transactions_cursor = transactions_cursor.limit(limit)
             transactions_list = await transactions_cursor.to_list(length=None)
             df = pd.DataFrame(transactions_list)
-            if '_id' in df.columns:
-                df = df.drop(columns=['_id'])
             
             # Ensure essential columns are present and correctly typed
             df['transactionDate'] = pd.to_datetime(df['transactionDate'], errors='coerce')
@@ -524,13 +529,11 @@ class ChurnService:
     async def _get_activity_data(self, limit: Optional[int] = None) -> pd.DataFrame:
         """Fetches user activity data from MongoDB."""
         try:
-            activities_cursor = self.db.user_activities.find({})
+            activities_cursor = self.db.user_activities.find({}, {'_id': 0})
             if limit:
                 activities_cursor = activities_cursor.limit(limit)
             activities_list = await activities_cursor.to_list(length=None)
             df = pd.DataFrame(activities_list)
-            if '_id' in df.columns:
-                df = df.drop(columns=['_id'])
             
             # Ensure datetime column is correctly parsed
             df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
@@ -544,10 +547,7 @@ class ChurnService:
     async def _get_user_details(self, user_id: str) -> Optional[Dict]:
         """Fetches details for a single user from MongoDB."""
         try:
-            user = await self.db.users.find_one({'userId': user_id})
-            if user and '_id' in user:
-                del user['_id']
-            return user
+            return await self.db.users.find_one({'userId': user_id}, {'_id': 0})
         except Exception as e:
             logger.error(f"Error fetching user details for {user_id}: {e}", exc_info=True)
             return None
@@ -555,126 +555,43 @@ class ChurnService:
     async def _get_product_data(self) -> pd.DataFrame:
         """Fetches all product data from MongoDB (needed for category mapping)."""
         try:
-            products_cursor = self.db.products.find({})
+            products_cursor = self.db.products.find({}, {'_id': 0})
             products_list = await products_cursor.to_list(length=None)
-            df = pd.DataFrame(products_list)
-            if '_id' in df.columns:
-                df = df.drop(columns=['_id'])
-            return df
+            return pd.DataFrame(products_list)
         except Exception as e:
             logger.error(f"Error fetching product data for churn service: {e}", exc_info=True)
             return pd.DataFrame()
 
+    async def _get_product_data_for_ids(self, product_ids: List[str]) -> pd.DataFrame:
+        """Fetches the category mapping for the given products only."""
+        if not product_ids:
+            return pd.DataFrame()
+        try:
+            products_cursor = self.db.products.find(
+                {'productId': {'$in': product_ids}}, {'_id': 0, 'productId': 1, 'category': 1}
+            )
+            products_list = await products_cursor.to_list(length=None)
+            return pd.DataFrame(products_list)
+        except Exception as e:
+            logger.error(f"Error fetching product data for {len(product_ids)} products: {e}", exc_info=True)
+            return pd.DataFrame()
+
     async def _prepare_churn_features_for_training(
-        self, users_df: pd.DataFrame, transactions_df: pd.DataFrame, activities_df: pd.DataFrame
+        self, users_df: pd.DataFrame, transactions_df: pd.DataFrame, activities_df: pd.DataFrame,
+        products_df: Optional[pd.DataFrame] = None
     ) -> pd.DataFrame:
         """
         Prepares comprehensive features for churn prediction from raw dataframes.
-        This method is designed to provide the combined DataFrame needed by ChurnPredictionModel.prepare_features.
+        If products_df is given it is used for the category mapping instead of fetching the full catalog.
+        The preparation itself is data_prep_utils.prepare_churn_features.
         """
-        # Ensure 'transactionDate' and 'timestamp' columns are datetime
-        if not transactions_df.empty:
-            transactions_df['transactionDate'] = pd.to_datetime(transactions_df['transactionDate'], errors='coerce')
-            transactions_df.dropna(subset=['transactionDate'], inplace=True)
-            
-        if not activities_df.empty:
-            activities_df['timestamp'] = pd.to_datetime(activities_df['timestamp'], errors='coerce')
-            activities_df.dropna(subset=['timestamp'], inplace=True)
-
-        if not users_df.empty:
-            users_df['registrationDate'] = pd.to_datetime(users_df['registrationDate'], errors='coerce')
-            users_df['lastLogin'] = pd.to_datetime(users_df['lastLogin'], errors='coerce')
-            users_df.dropna(subset=['registrationDate', 'lastLogin'], inplace=True)
-
-        # Merge transactions with product data to get 'category'
-        products_df = await self._get_product_data()
-        if not transactions_df.empty and not products_df.empty:
-            transactions_df = transactions_df.merge(
-                products_df[['productId', 'category']], on='productId', how='left'
-            )
-            transactions_df['category'].fillna('unknown', inplace=True)
-        elif 'category' not in transactions_df.columns:
-            transactions_df['category'] = 'unknown' # Add a default category if no products or no merge
-
-
-        # Consolidate transactions and user activities into a single "interactions" DataFrame per user
-        # This interaction DF will be the input to ChurnPredictionModel.prepare_features
-        all_interactions = []
-
-        if not transactions_df.empty:
-            transactions_for_model = transactions_df.rename(columns={
-                'transactionDate': 'timestamp',
-                'userId': 'user_id',
-                'totalPrice': 'amount',
-                'transactionId': 'transaction_id',
-                'productId': 'product_id'
-            })
-            # Add a 'type' to distinguish interaction source
-            transactions_for_model['interaction_type'] = 'purchase'
-            # Ensure 'quantity' and 'price' are numeric and present
-            transactions_for_model['quantity'] = pd.to_numeric(transactions_for_model['quantity'], errors='coerce').fillna(0)
-            # Derive price from amount and quantity
-            transactions_for_model['price'] = transactions_for_model['amount'] / transactions_for_model['quantity'].clip(lower=1)
-            transactions_for_model['price'] = pd.to_numeric(transactions_for_model['price'], errors='coerce').fillna(0)
-            all_interactions.append(transactions_for_model[[
-                'user_id', 'timestamp', 'transaction_id', 'amount', 'category', 'product_id', 'quantity', 'price', 'interaction_type'
-            ]])
-
-        if not activities_df.empty:
-            activities_for_model = activities_df.rename(columns={
-                'userId': 'user_id',
-                'activityId': 'transaction_id', # Use activityId as transaction_id for consistency for the model
-                'activityType': 'interaction_type'
-            })
-            # Fill missing columns expected by ChurnPredictionModel.prepare_features with defaults
-            activities_for_model['amount'] = 0.0 # No monetary value for most activities
-            activities_for_model['category'] = 'unknown'
-            activities_for_model['product_id'] = activities_for_model.get('productId', 'unknown_product') # Use existing productId or default
-            activities_for_model['quantity'] = 0 # No quantity for most activities
-            activities_for_model['price'] = 0.0 # No price for most activities
-            
-            all_interactions.append(activities_for_model[[
-                'user_id', 'timestamp', 'transaction_id', 'amount', 'category', 'product_id', 'quantity', 'price', 'interaction_type'
-            ]])
-        
-        if not all_interactions:
-            logger.warning("No interactions data prepared for churn model training.")
-            return pd.DataFrame()
-
-        # Concatenate all interaction types
-        combined_interactions_df = pd.concat(all_interactions, ignore_index=True)
-        
-        # Sort by user_id and timestamp, critical for RFM and sequential features
-        combined_interactions_df = combined_interactions_df.sort_values(by=['user_id', 'timestamp']).reset_index(drop=True)
-
-        # The churn model's prepare_features expects a dataframe that has
-        # 'user_id', 'timestamp', 'transaction_id', 'amount', 'category', 'product_id', 'quantity', 'price'
-        # The `prepare_features` within `ChurnPredictionModel` then aggregates this by user.
-        
-        # We also need to add 'registrationDate' and 'lastLogin' from users_df to `combined_interactions_df`
-        # as these are used for overall recency calculations in `ChurnPredictionModel.prepare_features`.
-        # The easiest way is to merge users_df *into* this interaction dataframe.
-        
-        final_df_for_model = combined_interactions_df.merge(
-            users_df[['userId', 'registrationDate', 'lastLogin']],
-            left_on='user_id', right_on='userId', how='left'
-        ).drop(columns=['userId']) # Drop redundant userId column after merge
-
-        # Ensure datetime columns are datetime objects after merge
-        final_df_for_model['registrationDate'] = pd.to_datetime(final_df_for_model['registrationDate'], errors='coerce')
-        final_df_for_model['lastLogin'] = pd.to_datetime(final_df_for_model['lastLogin'], errors='coerce')
-        final_df_for_model['timestamp'] = pd.to_datetime(final_df_for_model['timestamp'], errors='coerce')
-
-        final_df_for_model.dropna(subset=['user_id', 'timestamp'], inplace=True) # Essential columns
-
-        # Now call the ChurnPredictionModel's prepare_features to convert interactions to RFM features
-        rfm_features = self.churn_model.prepare_features(final_df_for_model)
-        
-        # Force garbage collection to free memory after heavy operations
-        del combined_interactions_df, final_df_for_model, users_df, transactions_df, activities_df
-        gc.collect()
-        
-        return rfm_features
+        # Skip the catalog fetch entirely when there are no transactions to map
+        if products_df is None and not transactions_df.empty:
+            products_df = await self._get_product_data()
+        return prepare_churn_features(
+            users_df, transactions_df, activities_df, products_df=products_df,
+            reference_date=self._get_run_ts(), churn_model=self.churn_model
+        )
     
     async def _prepare_single_user_features(self, user_id: str) -> pd.DataFrame:
         """Prepare features for a single user for churn prediction."""
@@ -683,28 +600,35 @@ class ChurnService:
             logger.warning(f"User {user_id} not found for single user feature preparation.")
             return pd.DataFrame()
 
-        transactions_cursor = self.db.transactions.find({'userId': user_id})
+        # '_id' is excluded at the projection layer so it never reaches pandas
+        transactions_cursor = self.db.transactions.find({'userId': user_id}, {'_id': 0})
         transactions_list = await transactions_cursor.to_list(length=None)
         transactions_df = pd.DataFrame(transactions_list)
 
-        activities_cursor = self.db.user_activities.find({'userId': user_id})
+        activities_cursor = self.db.user_activities.find({'userId': user_id}, {'_id': 0})
         activities_list = await activities_cursor.to_list(length=None)
         activities_df = pd.DataFrame(activities_list)
         
-        # Drop _id if present in fetched dataframes
-        if '_id' in transactions_df.columns:
-            transactions_df = transactions_df.drop(columns=['_id'])
-        if '_id' in activities_df.columns:
-            activities_df = activities_df.drop(columns=['_id'])
-        
+        # Only the products this user bought are needed for the category mapping
+        if 'productId' in transactions_df.columns:
+            products_df = await self._get_product_data_for_ids(transactions_df['productId'].dropna().unique().tolist())
+        else:
+            products_df = pd.DataFrame()
+
         # Prepare the dataframes for _prepare_churn_features_for_training
         # It expects a list of users, transactions, and activities as dataframes
-        users_df_single = pd.DataFrame([user]) # Convert single user dict to DataFrame
+        # The users frame is not read by the preparation, so build that single row
+        # column-wise instead of inferring a frame from the whole record
+        users_df_single = pd.DataFrame({
+            'userId': [user['userId']],
+            'registrationDate': [user.get('registrationDate')],
+            'lastLogin': [user.get('lastLogin')]
+        })
 
         # Now, call the batch preparation method with these single-user (or empty) dataframes
         # This ensures consistent feature engineering logic
         combined_features_df = await self._prepare_churn_features_for_training(
-            users_df_single, transactions_df, activities_df
+            users_df_single, transactions_df, activities_df, products_df=products_df
         )
 
         # Filter for the specific user and ensure it's a single row DataFrame for prediction
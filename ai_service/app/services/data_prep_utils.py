@@ -0,0 +1,213 @@
+"""
+Data preparation utilities shared between services
+Builds churn model inputs from raw user, transaction and activity frames
+"""
+
+import logging
+from datetime import datetime
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+from app.models.advanced_models import ChurnPredictionModel
+
+logger = logging.getLogger(__name__)
+
+# Feature preparation reads no model state, so callers without a model share this one
+_FEATURE_PREP_MODEL = ChurnPredictionModel()
+
+
+def map_lookup(keys: pd.Series, lookup: pd.Series) -> pd.Series:
+    """
+    Maps keys through a lookup Series indexed by key. Categorical keys would map to a
+    categorical result when the mapping is one-to-one; the result is returned in the
+    lookup values' own dtype instead, so numeric lookups stay numeric and fillna works.
+    """
+    mapped = keys.map(lookup)
+    if isinstance(mapped.dtype, pd.CategoricalDtype):
+        mapped = mapped.astype(mapped.cat.categories.dtype)
+    return mapped
+
+
+def _as_datetime(values: pd.Series) -> pd.Series:
+    """Parses a date column, returning NaT for unparseable values; datetime64 columns pass through as is."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, errors='coerce')
+
+
+def _to_epoch_ns(values: pd.Series) -> pd.Series:
+    """Parses a date column to naive datetime64[ns], returning NaT for unparseable values."""
+    parsed = _as_datetime(values)
+    if getattr(parsed.dt, 'tz', None) is not None:
+        parsed = parsed.dt.tz_convert(None)
+    return parsed.astype('datetime64[ns]')
+
+
+def aggregate_user_interactions(
+    user_ids: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray,
+    product_ids: np.ndarray, categories: np.ndarray, has_interaction_id: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Reduces flat interaction arrays to one row per user with the columns expected by
+    ChurnPredictionModel.prepare_features_from_aggregates.
+
+    Users are factorized once and every statistic is a bincount/reduceat over the
+    user codes, so no per-group Python work or intermediate interactions frame is
+    needed. Missing user ids are dropped, missing amounts are skipped like pandas'
+    sum/mean/std, and missing product ids do not count towards product diversity.
+    """
+    user_codes, user_index = pd.factorize(user_ids, sort=True)
+    keep = user_codes >= 0
+    if not keep.all():
+        user_codes = user_codes[keep]
+        timestamps, amounts = timestamps[keep], amounts[keep]
+        product_ids, categories = product_ids[keep], categories[keep]
+        if has_interaction_id is not None:
+            has_interaction_id = has_interaction_id[keep]
+    n_users = len(user_index)
+    if n_users == 0:
+        return pd.DataFrame()
+
+    # Segment boundaries of each user's rows once sorted by user code
+    order = np.argsort(user_codes, kind='stable')
+    rows_per_user = np.bincount(user_codes, minlength=n_users)
+    starts = np.concatenate(([0], np.cumsum(rows_per_user)[:-1]))
+    epoch_ns = timestamps.view('i8')[order]
+
+    frequency = rows_per_user if has_interaction_id is None else \
+        np.bincount(user_codes, weights=has_interaction_id, minlength=n_users).astype(np.int64)
+
+    amounts = amounts.astype(np.float64, copy=False)
+    valid = ~np.isnan(amounts)
+    n_valid = np.bincount(user_codes, weights=valid, minlength=n_users)
+    total_spent = np.bincount(user_codes, weights=np.where(valid, amounts, 0.0), minlength=n_users)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_order_value = np.where(n_valid > 0, total_spent / n_valid, np.nan)
+        squared_dev = np.where(valid, (amounts - avg_order_value[user_codes]) ** 2, 0.0)
+        spending_volatility = np.where(
+            n_valid > 1, np.bincount(user_codes, weights=squared_dev, minlength=n_users) / (n_valid - 1), np.nan
+        ) ** 0.5
+
+    # Distinct (user, value) pairs give the per-user nunique counts
+    product_codes, product_index = pd.factorize(product_ids)
+    has_product = product_codes >= 0
+    product_pairs = np.unique(user_codes[has_product].astype(np.int64) * len(product_index) + product_codes[has_product])
+    product_diversity = np.bincount(product_pairs // max(len(product_index), 1), minlength=n_users)
+
+    category_codes, category_index = pd.factorize(categories)
+    has_category = category_codes >= 0
+    category_pairs = np.unique(user_codes[has_category].astype(np.int64) * len(category_index) + category_codes[has_category])
+    category_users = category_pairs // max(len(category_index), 1)
+    category_values = np.asarray(category_index, dtype=object)[category_pairs % max(len(category_index), 1)]
+    category_splits = np.searchsorted(category_users, np.arange(1, n_users))
+
+    return pd.DataFrame({
+        'user_id': np.asarray(user_index, dtype=object),
+        'first_seen': np.minimum.reduceat(epoch_ns, starts).view('datetime64[ns]'),
+        'last_seen': np.maximum.reduceat(epoch_ns, starts).view('datetime64[ns]'),
+        'frequency': frequency,
+        'total_spent': total_spent,
+        'avg_order_value': avg_order_value,
+        'spending_volatility': spending_volatility,
+        'product_diversity': product_diversity,
+        'categories': [list(values) for values in np.split(category_values, category_splits)]
+    })
+
+
+def _interaction_arrays(
+    transactions_df: pd.DataFrame, activities_df: pd.DataFrame, products_df: Optional[pd.DataFrame] = None
+) -> List[tuple]:
+    """
+    Extracts the aggregate_user_interactions arguments from the transactions and the
+    activities, one tuple of arrays per non-empty source. Rows without a parseable date
+    are dropped. Transaction categories come from products_df when the transactions
+    carry none; activities carry no money, category or (possibly) product.
+    """
+    parts = []
+
+    if not transactions_df.empty:
+        transaction_times = _to_epoch_ns(transactions_df['transactionDate'])
+        tx = transactions_df[transaction_times.notna().to_numpy()]
+        if 'category' in tx.columns:
+            tx_categories = tx['category']
+        elif products_df is not None and not products_df.empty:
+            category_map = products_df.drop_duplicates('productId').set_index('productId')['category']
+            tx_categories = map_lookup(tx['productId'], category_map)
+        else:
+            tx_categories = pd.Series('unknown', index=tx.index)
+        parts.append((
+            tx['userId'].to_numpy(dtype=object),
+            transaction_times.dropna().to_numpy(),
+            pd.to_numeric(tx['totalPrice'], errors='coerce').to_numpy(dtype=np.float64),
+            tx['productId'].to_numpy(dtype=object),
+            tx_categories.fillna('unknown').to_numpy(dtype=object),
+            tx['transactionId'].notna().to_numpy() if 'transactionId' in tx.columns else np.ones(len(tx), dtype=bool)
+        ))
+
+    if not activities_df.empty:
+        activity_times = _to_epoch_ns(activities_df['timestamp'])
+        act = activities_df[activity_times.notna().to_numpy()]
+        parts.append((
+            act['userId'].to_numpy(dtype=object),
+            activity_times.dropna().to_numpy(),
+            np.zeros(len(act)), # No monetary value for activities
+            act['productId'].to_numpy(dtype=object) if 'productId' in act.columns
+            else np.full(len(act), 'unknown_product', dtype=object),
+            np.full(len(act), 'unknown', dtype=object),
+            act['activityId'].notna().to_numpy() if 'activityId' in act.columns else np.ones(len(act), dtype=bool)
+        ))
+
+    return parts
+
+
+def prepare_churn_prediction_features(
+    users_df: pd.DataFrame, transactions_df: pd.DataFrame, activities_df: pd.DataFrame,
+    products_df: Optional[pd.DataFrame] = None, churn_model: Optional[ChurnPredictionModel] = None
+) -> pd.DataFrame:
+    """
+    Prepares churn features for prediction directly from the raw frames.
+
+    Equivalent to building the consolidated interactions frame and calling
+    ChurnPredictionModel.prepare_features on it, but the per-user reduction runs
+    on NumPy arrays extracted once per column (see aggregate_user_interactions).
+    users_df is accepted for signature parity; the features only depend on the
+    interactions. Transaction categories come from products_df when the
+    transactions carry none. churn_model only provides the feature derivation
+    (prepare_features_from_aggregates); the shared untrained model is used if none is given.
+    """
+    parts = _interaction_arrays(transactions_df, activities_df, products_df)
+
+    if not parts or sum(len(part[0]) for part in parts) == 0:
+        logger.warning("No interactions data prepared for churn model prediction.")
+        return pd.DataFrame()
+
+    user_aggregates = aggregate_user_interactions(*(np.concatenate(columns) for columns in zip(*parts)))
+    return (churn_model or _FEATURE_PREP_MODEL).prepare_features_from_aggregates(user_aggregates)
+
+
+def prepare_churn_features(
+    users_df: pd.DataFrame, transactions_df: pd.DataFrame, activities_df: pd.DataFrame,
+    products_df: Optional[pd.DataFrame] = None, reference_date: Optional[datetime] = None,
+    churn_model: Optional[ChurnPredictionModel] = None
+) -> pd.DataFrame:
+    """
+    Prepares comprehensive features for churn model training from raw dataframes.
+    Reduces the transactions and activities to per-user aggregates (the same arrays as
+    prepare_churn_prediction_features) and derives the features through churn_model
+    (a shared untrained model if none is given).
+    Transaction categories come from products_df when the transactions carry none,
+    and are 'unknown' otherwise. users_df is accepted for signature parity; the features only depend on the interactions.
+    reference_date is the caller's "now" snapshot, the recency fallback passed on to
+    prepare_features_from_aggregates (recency is otherwise measured from the newest interaction).
+    """
+    parts = _interaction_arrays(transactions_df, activities_df, products_df)
+
+    if not parts or sum(len(part[0]) for part in parts) == 0:
+        logger.warning("No interactions data prepared for churn model training.")
+        return pd.DataFrame()
+
+    user_aggregates = aggregate_user_interactions(*(np.concatenate(columns) for columns in zip(*parts)))
+    return (churn_model or _FEATURE_PREP_MODEL).prepare_features_from_aggregates(
+        user_aggregates, reference_date=reference_date
+    )
@@ -1,19 +1,113 @@
 # ai_service/app/services/data_processor.py
+import asyncio
+import time
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from typing import List, Optional
+from scipy.sparse import coo_matrix
+from typing import Dict, List, Optional, Tuple
 from app.config import settings
+from app.database import aggregate_cursor
 from app.utils.logger import logger
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo import MongoClient
 
+# Settings read on every call, resolved once at import
+_MAX_TRANSACTIONS_CHUNK = getattr(settings, 'MAX_TRANSACTIONS_CHUNK', 2000)
+
+# Fields the windowed transaction readers hand on to their consumers (forecasting, pricing)
+_TXN_PROJECTION = {"_id": 0, "transactionDate": 1, "totalPrice": 1, "quantity": 1, "userId": 1, "productId": 1}
+# The chunked reader pages on _id and pricing also keys on transactionId
+_TXN_CHUNK_PROJECTION = {**_TXN_PROJECTION, "_id": 1, "transactionId": 1}
+
+# Typed record layouts for the projected transaction reads; numeric fields default to 0
+_TXN_RECORD_DTYPE = np.dtype([
+    ('transactionDate', 'datetime64[ns]'), ('totalPrice', 'f8'), ('quantity', 'i8'), ('userId', 'O'), ('productId', 'O')
+])
+_TXN_CHUNK_RECORD_DTYPE = np.dtype(_TXN_RECORD_DTYPE.descr + [('transactionId', 'O')])
+_TXN_CATEGORICAL_COLUMNS = ['userId', 'productId']
+
+def _typed_transaction_records(transactions_list: list, dtype: np.dtype) -> np.ndarray:
+    """Packs raw transaction documents into a structured array of the given record layout."""
+    fields = [(name, dtype[name].kind in 'if') for name in dtype.names]
+    return np.fromiter(
+        (tuple((doc.get(name) or 0) if numeric else doc.get(name) for name, numeric in fields) for doc in transactions_list),
+        dtype, count=len(transactions_list)
+    )
+
+def _transaction_records_to_frame(records: np.ndarray) -> pd.DataFrame:
+    """
+    Wraps a typed record array in a DataFrame. The user/product id columns are
+    dictionary-encoded as categoricals, so joins and groupbys on them hash small
+    integer codes instead of one Python string per row. Per-row unique ids such as
+    transactionId stay plain objects; a dictionary would be as large as the column.
+    """
+    df = pd.DataFrame.from_records(records)
+    df[_TXN_CATEGORICAL_COLUMNS] = df[_TXN_CATEGORICAL_COLUMNS].astype('category')
+    return df
+
+def _typed_transactions_frame(transactions_list: list, dtype: np.dtype) -> pd.DataFrame:
+    """
+    Builds a DataFrame from raw transaction documents directly into typed columns,
+    skipping pandas' object inference and the to_datetime/to_numeric re-parsing passes.
+    """
+    return _transaction_records_to_frame(_typed_transaction_records(transactions_list, dtype))
+
+def _as_object_column(column: np.ndarray) -> np.ndarray:
+    """Object copy of a typed column; datetimes go through microseconds so they become datetime objects."""
+    if column.dtype.kind == 'M':
+        column = column.astype('datetime64[us]')
+    return column.astype(object)
+
+async def _stream_documents_to_frame(cursor, capacity: int, dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Drains a cursor with `async for` straight into preallocated per-field arrays
+    (at most `capacity` documents), so no intermediate list of dicts is held next to
+    the resulting frame. Fields are discovered as they appear; documents missing a
+    field get NaN, as with the DataFrame record constructor.
+    Fields named in `dtypes` are written into arrays of that dtype (missing values
+    stay NaN/NaT) and skip type inference; a value that does not convert demotes
+    its column to object, leaving it to the caller's own parsing.
+    """
+    dtypes = dtypes or {}
+    columns = {}
+    count = 0
+    async for doc in cursor:
+        for key, value in doc.items():
+            column = columns.get(key)
+            if column is None:
+                dtype = np.dtype(dtypes.get(key, object))
+                column = columns[key] = np.full(capacity, np.datetime64('NaT') if dtype.kind == 'M' else np.nan, dtype=dtype)
+            if value is None and column.dtype != object:
+                continue
+            try:
+                column[count] = value
+            except (TypeError, ValueError):
+                column = columns[key] = _as_object_column(column)
+                column[count] = value
+        count += 1
+    if count == 0:
+        return pd.DataFrame()
+    return pd.DataFrame({key: column[:count] for key, column in columns.items()}, copy=False).infer_objects()
+
+def _count_unique_days(timestamps: pd.Series) -> int:
+    """Number of distinct calendar days in a datetime series, computed on the datetime64 buffer."""
+    days = timestamps.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    return np.unique(days[~np.isnat(days)]).size
+
 class DataProcessor:
     """
     Handles fetching and initial processing of raw data from MongoDB.
     """
+    # Slow-changing reads are cached across instances (one is created per request),
+    # keyed by database and arguments: {key: (expires_at, DataFrame)}
+    CACHE_TTL_SECONDS = 300
+    _ttl_cache: Dict[tuple, Tuple[float, pd.DataFrame]] = {}
+
     def __init__(self, db=None, sync_db=None):
-        self._db = db  # Expected to be AsyncIOMotorDatabase
+        self._db = db  # Async database: Motor AsyncIOMotorDatabase or PyMongo AsyncDatabase
         self._sync_db = sync_db  # For synchronous operations if needed
+        self._run_ts: Optional[datetime] = None  # "now" snapshot shared by every fetch of this instance (one per run)
 
         if self._db is None and self._sync_db is None:
             raise ValueError("Either an async or a sync database connection must be provided.")
@@ -32,48 +126,62 @@ class DataProcessor:
         else:
             raise RuntimeError("No sync database client available.")
 
+    def _cache_get(self, *key) -> Optional[pd.DataFrame]:
+        """Returns a copy of the cached frame for key if it has not expired."""
+        entry = DataProcessor._ttl_cache.get((id(self._db),) + key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1].copy()
+
+    def _cache_put(self, df: pd.DataFrame, *key):
+        """Caches a non-empty frame for key for CACHE_TTL_SECONDS."""
+        if not df.empty:
+            DataProcessor._ttl_cache[(id(self._db),) + key] = (time.monotonic() + self.CACHE_TTL_SECONDS, df.copy())
+
+    def _get_run_ts(self) -> datetime:
+        """Returns the per-run "now" snapshot, taking it on first use."""
+        if self._run_ts is None:
+            self._run_ts = datetime.utcnow()  # BSON dates are UTC; naive UTC matches what PyMongo stores and returns
+        return self._run_ts
+
     async def get_transactions_data(self, days: int = settings.DATA_COLLECTION_DAYS, limit: Optional[int] = None) -> pd.DataFrame:
         """
         Fetches transaction data for a specified number of past days.
         """
-        end_date = datetime.now()
+        end_date = self._get_run_ts()
         start_date = end_date - timedelta(days=days)
         
         # Apply memory-safe limit for Phase 3 model training
         if limit is None:
-            limit = getattr(settings, 'MAX_TRANSACTIONS_CHUNK', 2000)  # Default from config
+            limit = _MAX_TRANSACTIONS_CHUNK  # Default from config
 
-        logger.info(f"Fetching transaction data from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')} (limit: {limit})")
+        logger.info("Fetching transaction data from {:%Y-%m-%d} to {:%Y-%m-%d} (limit: {})", start_date, end_date, limit)
 
         try:
             transactions_cursor = self._get_async_db().transactions.find(
                 {"transactionDate": {"$gte": start_date, "$lte": end_date}}
             ).sort("transactionDate", -1).limit(limit)  # Sort by newest first and apply limit
-            transactions_list = await transactions_cursor.to_list(length=limit)
+            df = await _stream_documents_to_frame(transactions_cursor, limit)
 
-            if not transactions_list:
+            if df.empty:
                 logger.warning(f"No transaction data found for the last {days} days.")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(transactions_list)
-
-            # Ensure 'transactionDate' is datetime and then rename to 'timestamp'
-            df['transactionDate'] = pd.to_datetime(df['transactionDate'])
-            df = df.sort_values('transactionDate').reset_index(drop=True)
-            df.rename(columns={'transactionDate': 'timestamp'}, inplace=True) # Renamed for consistency with feature engineering
+            # Rename once: 'timestamp' for consistency with feature engineering and
+            # IMPORTANT: 'totalAmount' (from 'totalPrice') for consistency with models
+            df.rename(columns={'transactionDate': 'timestamp', 'totalPrice': 'totalAmount'}, inplace=True)
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
 
-            # IMPORTANT: Rename 'totalPrice' to 'totalAmount' for consistency with models
-            if 'totalPrice' in df.columns:
-                df.rename(columns={'totalPrice': 'totalAmount'}, inplace=True)
-                # Ensure 'totalAmount' is numeric
-                df['totalAmount'] = pd.to_numeric(df['totalAmount'], errors='coerce').fillna(0)
-            else:
+            if 'totalAmount' not in df.columns:
                 logger.warning("Column 'totalPrice' not found in transactions data. Forecasting model may fail.")
                 df['totalAmount'] = 0.0 # Provide a default if column missing
 
-            # Ensure 'quantity' is numeric for anomaly detection and other uses
-            if 'quantity' in df.columns:
-                df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+            # Coerce the numeric columns in one pass ('quantity' is used by anomaly detection and others)
+            numeric_cols = [col for col in ('totalAmount', 'quantity') if col in df.columns]
+            df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+
+            # The cursor already returned newest first, so reversing gives ascending time order without a sort
+            df = df.iloc[::-1].reset_index(drop=True)
 
             logger.info(f"Fetched {len(df)} transactions.")
             return df
@@ -88,76 +196,61 @@ class DataProcessor:
         Memory-efficient version that loads data in chunks to prevent RAM overload.
         DRASTICALLY reduced chunk size and max records for memory conservation.
         """
-        end_date = datetime.now()
+        end_date = self._get_run_ts()
         start_date = end_date - timedelta(days=days)
 
         # Limit days and max_records for memory conservation
         days = min(days, 3)  # Maximum 3 days
         max_records = min(max_records or 2000, 2000)  # Maximum 2000 records
 
-        logger.info(f"Fetching transaction data in chunks (size: {chunk_size}) from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}, max_records: {max_records}")
+        logger.info("Fetching transaction data in chunks (size: {}) from {:%Y-%m-%d} to {:%Y-%m-%d}, max_records: {}", chunk_size, start_date, end_date, max_records)
 
         try:
-            # Count total records first
-            total_count = await self._get_async_db().transactions.count_documents(
-                {"transactionDate": {"$gte": start_date, "$lte": end_date}}
-            )
-            
-            if total_count > max_records:
-                logger.warning(f"Limiting data to {max_records} records (found {total_count})")
-                total_count = max_records
-
-            if total_count == 0:
-                logger.warning(f"No transaction data found for the last {days} days.")
-                return pd.DataFrame()
+            # Page by _id instead of skip/limit so every chunk is an index range scan
+            # of chunk_size documents, no matter how far into the window we are
+            query = {"transactionDate": {"$gte": start_date, "$lte": end_date}}
+            # max_records bounds the result, so chunks are written into one preallocated
+            # record array at their offsets instead of being concatenated at the end
+            records = np.empty(max_records, dtype=_TXN_CHUNK_RECORD_DTYPE)
+            fetched = 0
+            last_id = None
+
+            while fetched < max_records:
+                current_chunk_size = min(chunk_size, max_records - fetched)
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
 
-            # Process data in chunks
-            dfs = []
-            skip = 0
-            
-            while skip < total_count:
-                current_chunk_size = min(chunk_size, total_count - skip)
-                
                 cursor = self._get_async_db().transactions.find(
-                    {"transactionDate": {"$gte": start_date, "$lte": end_date}}
-                ).skip(skip).limit(current_chunk_size)
-                
+                    query, _TXN_CHUNK_PROJECTION
+                ).sort("_id", 1).limit(current_chunk_size)
                 chunk_data = await cursor.to_list(length=current_chunk_size)
-                
-                if chunk_data:
-                    chunk_df = pd.DataFrame(chunk_data)
-                    
-                    # Remove MongoDB _id to save memory
-                    if '_id' in chunk_df.columns:
-                        chunk_df = chunk_df.drop(columns=['_id'])
-                    
-                    # Process chunk immediately to save memory
-                    chunk_df['transactionDate'] = pd.to_datetime(chunk_df['transactionDate'])
-                    
-                    # Keep totalPrice column name for compatibility with pricing service
-                    if 'totalPrice' in chunk_df.columns:
-                        chunk_df['totalPrice'] = pd.to_numeric(chunk_df['totalPrice'], errors='coerce').fillna(0)
-                    
-                    if 'quantity' in chunk_df.columns:
-                        chunk_df['quantity'] = pd.to_numeric(chunk_df['quantity'], errors='coerce').fillna(0)
-                    
-                    dfs.append(chunk_df)
-                
-                skip += current_chunk_size
-                
+
+                if not chunk_data:
+                    break
+
+                last_id = chunk_data[-1]["_id"]
+
+                # Typed ingest; _id is only the paging key above and is not carried over.
+                # Keep totalPrice column name for compatibility with pricing service
+                records[fetched:fetched + len(chunk_data)] = _typed_transaction_records(chunk_data, _TXN_CHUNK_RECORD_DTYPE)
+                fetched += len(chunk_data)
+
                 # Log progress for large datasets
-                if skip % (chunk_size * 10) == 0:
-                    logger.info(f"Processed {skip}/{total_count} records...")
+                if fetched % (chunk_size * 10) == 0:
+                    logger.info(f"Processed {fetched} records...")
+
+                if len(chunk_data) < current_chunk_size:
+                    break
 
-            # Combine chunks efficiently
-            if dfs:
-                df = pd.concat(dfs, ignore_index=True)
+            if fetched:
+                df = _transaction_records_to_frame(records[:fetched])
                 df = df.sort_values('transactionDate').reset_index(drop=True)
                 df.rename(columns={'transactionDate': 'timestamp'}, inplace=True)
                 
                 logger.info(f"Fetched {len(df)} transactions in chunks.")
                 return df
             else:
+                logger.warning(f"No transaction data found for the last {days} days.")
                 return pd.DataFrame()
 
         except Exception as e:
@@ -169,22 +262,24 @@ class DataProcessor:
         Fetches user activity and feedback data for a specified number of past days.
         Combines user_activities and feedback collections.
         """
-        end_date = datetime.now()
+        end_date = self._get_run_ts()
         start_date = end_date - timedelta(days=days)
 
-        logger.info(f"Fetching user behavior data (activities and feedback) from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
+        logger.info("Fetching user behavior data (activities and feedback) from {:%Y-%m-%d} to {:%Y-%m-%d}", start_date, end_date)
 
         try:
+            # The two reads are independent, so overlap their round trips
             activities_cursor = self._get_async_db().user_activities.find(
-                {"timestamp": {"$gte": start_date, "$lte": end_date}}
+                {"timestamp": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
             )
-            activities_list = await activities_cursor.to_list(length=None)
-            activities_df = pd.DataFrame(activities_list)
-
             feedback_cursor = self._get_async_db().feedback.find(
-                {"feedbackDate": {"$gte": start_date, "$lte": end_date}}
+                {"feedbackDate": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
+            )
+            activities_list, feedback_list = await asyncio.gather(
+                activities_cursor.to_list(length=None),
+                feedback_cursor.to_list(length=None)
             )
-            feedback_list = await feedback_cursor.to_list(length=None)
+            activities_df = pd.DataFrame(activities_list)
             feedback_df = pd.DataFrame(feedback_list)
 
             if not activities_df.empty:
@@ -226,9 +321,13 @@ class DataProcessor:
         """
         Fetches product data.
         """
+        cached = self._cache_get('products')
+        if cached is not None:
+            return cached
+
         logger.info("Fetching product data.")
         try:
-            products_cursor = self._get_async_db().products.find({})
+            products_cursor = self._get_async_db().products.find({}, {"_id": 0})
             products_list = await products_cursor.to_list(length=None)
 
             if not products_list:
@@ -237,11 +336,21 @@ class DataProcessor:
 
             df = pd.DataFrame(products_list)
             logger.info(f"Fetched {len(df)} products.")
+            self._cache_put(df, 'products')
             return df
         except Exception as e:
             logger.error(f"Error fetching product data: {e}", exc_info=True)
             return pd.DataFrame()
 
+    @staticmethod
+    def _is_day_aligned_tick(freq: str) -> bool:
+        """True for fixed frequencies that evenly divide a day, where flooring matches resample's bins."""
+        try:
+            offset = pd.tseries.frequencies.to_offset(freq)
+        except ValueError:
+            return False
+        return isinstance(offset, pd.offsets.Tick) and pd.Timedelta(days=1) % pd.Timedelta(offset) == pd.Timedelta(0)
+
     def prepare_time_series_data(self, df: pd.DataFrame, value_col: str, freq: str = 'D') -> pd.DataFrame:
         """
         Prepares time series data (e.g., daily sales) from a DataFrame.
@@ -251,72 +360,141 @@ class DataProcessor:
             logger.warning("Input DataFrame is empty for time series preparation.")
             return pd.DataFrame()
 
-        logger.info(f"Preparing time series from {len(df)} transactions spanning {df['timestamp'].dt.date.nunique()} unique dates")
-
-        # Ensure 'timestamp' is the index and is a DatetimeIndex
-        df_ts = df.set_index('timestamp')
-        df_ts.index = pd.to_datetime(df_ts.index)
+        logger.info(f"Preparing time series from {len(df)} transactions spanning {_count_unique_days(df['timestamp'])} unique dates")
 
-        # Resample and sum, then fill NaNs from resampling with 0
-        df_ts = df_ts.resample(freq)[value_col].sum().fillna(0).to_frame()
-        df_ts.columns = [value_col]
-        df_ts = df_ts.reset_index()
+        if freq == 'D':
+            # Daily buckets are just integer day offsets, so sum them with a single bincount
+            timestamps = pd.to_datetime(df['timestamp'])
+            valid = timestamps.notna().to_numpy()
+            days_i8 = timestamps.to_numpy()[valid].astype('datetime64[D]').view('i8')
+            if days_i8.size == 0:
+                logger.warning("No valid timestamps found for time series preparation.")
+                return pd.DataFrame()
+            first_day = days_i8.min()
+            values = np.nan_to_num(df[value_col].to_numpy(dtype='float64')[valid])
+            daily_totals = np.bincount(days_i8 - first_day, weights=values)
+            daily_index = np.arange(first_day, first_day + len(daily_totals)).astype('datetime64[D]')
+            df_ts = pd.DataFrame({'timestamp': daily_index.astype('datetime64[ns]'), value_col: daily_totals})
+        elif self._is_day_aligned_tick(freq):
+            # Fixed intra-day buckets: floor the timestamps and group on them directly,
+            # then fill the empty buckets, instead of building a Resampler over a DatetimeIndex
+            timestamps = pd.to_datetime(df['timestamp'])
+            if timestamps.notna().sum() == 0:
+                logger.warning("No valid timestamps found for time series preparation.")
+                return pd.DataFrame()
+            bucket_totals = df[value_col].groupby(timestamps.dt.floor(freq), sort=True).sum()
+            full_range = pd.date_range(bucket_totals.index.min(), bucket_totals.index.max(), freq=freq)
+            df_ts = bucket_totals.reindex(full_range, fill_value=0).rename_axis('timestamp').reset_index(name=value_col)
+        else:
+            # Calendar frequencies (weeks, months, ...) keep resample's labelling rules
+            # Ensure 'timestamp' is the index and is a DatetimeIndex
+            df_ts = df.set_index('timestamp')
+            df_ts.index = pd.to_datetime(df_ts.index)
+
+            # Resample and sum, then fill NaNs from resampling with 0
+            df_ts = df_ts.resample(freq)[value_col].sum().fillna(0).to_frame()
+            df_ts.columns = [value_col]
+            df_ts = df_ts.reset_index()
         
         logger.info(f"Prepared time series data with frequency '{freq}' for '{value_col}'. Rows: {len(df_ts)} (need 16+ for forecasting)")
         return df_ts
 
+    async def has_user_item_data(self) -> bool:
+        """
+        Cheap check that get_user_item_matrix has something to build from: at least one
+        transaction in its collection window, found with a limit-1 count over the date range.
+        """
+        end_date = self._get_run_ts()
+        start_date = end_date - timedelta(days=settings.DATA_COLLECTION_DAYS)
+        try:
+            count = await self._get_async_db().transactions.count_documents(
+                {"transactionDate": {"$gte": start_date, "$lte": end_date}}, limit=1
+            )
+            return count > 0
+        except Exception as e:
+            logger.error(f"Error checking for user-item interaction data: {e}", exc_info=True)
+            return False
+
     async def get_user_item_matrix(self, min_interactions: int = settings.MIN_INTERACTIONS_FOR_RECOMMENDATION) -> pd.DataFrame:
         """
         Generates a user-item interaction matrix from transaction data.
         Filters out users/items with too few interactions.
         """
+        cached = self._cache_get('user_item_matrix', min_interactions)
+        if cached is not None:
+            return cached
+
         logger.info("Generating user-item interaction matrix...")
         try:
-            transactions_df = await self.get_transactions_data(days=settings.DATA_COLLECTION_DAYS)
-            if transactions_df.empty:
+            end_date = self._get_run_ts()
+            start_date = end_date - timedelta(days=settings.DATA_COLLECTION_DAYS)
+            limit = _MAX_TRANSACTIONS_CHUNK
+
+            # Aggregate quantity per user-product pair (implicit rating) on the server, over the
+            # same most-recent window get_transactions_data reads, so only the pairs come back
+            pipeline = [
+                {"$match": {"transactionDate": {"$gte": start_date, "$lte": end_date}}},
+                {"$sort": {"transactionDate": -1}},
+                {"$limit": limit},
+                {"$group": {"_id": {"u": "$userId", "p": "$productId"}, "interaction_count": {"$sum": "$quantity"}}},
+                {"$project": {"_id": 0, "userId": "$_id.u", "productId": "$_id.p", "interaction_count": 1}}
+            ]
+            interactions_cursor = await aggregate_cursor(self._get_async_db().transactions, pipeline)
+            interactions_list = await interactions_cursor.to_list(length=None)
+            if not interactions_list:
                 logger.warning("No transactions data to build user-item matrix.")
                 return pd.DataFrame()
 
             # Ensure correct data types
-            transactions_df['userId'] = transactions_df['userId'].astype(str)
-            transactions_df['productId'] = transactions_df['productId'].astype(str)
-            transactions_df['quantity'] = transactions_df['quantity'].astype(int)
-
-            # Aggregate quantity per user-product pair (implicit rating)
-            user_item_interactions = transactions_df.groupby(['userId', 'productId'])['quantity'].sum().reset_index()
-            user_item_interactions.rename(columns={'quantity': 'interaction_count'}, inplace=True)
-
-            # Filter out users with too few interactions (with fallback strategy)
-            user_counts = user_item_interactions.groupby('userId').size()
-            valid_users = user_counts[user_counts >= min_interactions].index
+            user_item_interactions = pd.DataFrame(interactions_list, columns=['userId', 'productId', 'interaction_count'])
+            # Ids become categoricals (sorted categories, small integer codes) so the
+            # filtering and matrix assembly below run on codes rather than Python strings
+            user_item_interactions['userId'] = user_item_interactions['userId'].astype(str).astype('category')
+            user_item_interactions['productId'] = user_item_interactions['productId'].astype(str).astype('category')
+            user_item_interactions['interaction_count'] = user_item_interactions['interaction_count'].astype(int)
+
+            # Filter out users with too few interactions (with fallback strategy).
+            # Count per user code once; each threshold is then a mask over the codes.
+            user_codes = user_item_interactions['userId'].cat.codes.to_numpy()
+            user_counts = np.bincount(user_codes)
+            valid_users = user_counts >= min_interactions
             
             # If no users meet the minimum threshold, try with a lower threshold
-            if len(valid_users) == 0:
+            if not valid_users.any():
                 fallback_min = max(1, min_interactions - 2)
                 logger.warning(f"No users with {min_interactions}+ interactions. Trying fallback with {fallback_min}+ interactions.")
-                valid_users = user_counts[user_counts >= fallback_min].index
+                valid_users = user_counts >= fallback_min
                 
                 # If still no users, use all users with at least 1 interaction
-                if len(valid_users) == 0:
+                if not valid_users.any():
                     logger.warning("Using all users with at least 1 interaction for recommendation model.")
-                    valid_users = user_counts[user_counts >= 1].index
+                    valid_users = user_counts >= 1
             
-            user_item_interactions = user_item_interactions[user_item_interactions['userId'].isin(valid_users)]
+            user_item_interactions = user_item_interactions[valid_users[user_codes]]
 
             if user_item_interactions.empty:
                 logger.warning(f"No user-item interactions found even with fallback strategy.")
                 return pd.DataFrame()
             
-            logger.info(f"Using {len(valid_users)} users for recommendation model training.")
-
-            # Create pivot table (user-item matrix)
-            user_item_matrix = user_item_interactions.pivot_table(
-                index='userId',
-                columns='productId',
-                values='interaction_count'
-            ).fillna(0) # Fill NaN with 0 for no interaction
+            logger.info(f"Using {int(valid_users.sum())} users for recommendation model training.")
+
+            # Build the user-item matrix sparse: almost every user/product cell is zero,
+            # so a dense pivot would materialise |users| x |products| floats for nothing.
+            # It is wrapped in a sparse-backed DataFrame so callers keep the labelled API.
+            users = user_item_interactions['userId'].cat.remove_unused_categories()
+            products = user_item_interactions['productId'].cat.remove_unused_categories()
+            interactions = coo_matrix(
+                (user_item_interactions['interaction_count'].to_numpy(dtype=np.float64), (users.cat.codes, products.cat.codes)),
+                shape=(len(users.cat.categories), len(products.cat.categories))
+            ).tocsr()
+            user_item_matrix = pd.DataFrame.sparse.from_spmatrix(
+                interactions,
+                index=pd.Index(users.cat.categories, name='userId'),
+                columns=pd.Index(products.cat.categories, name='productId')
+            )
 
             logger.info(f"Generated user-item matrix with shape: {user_item_matrix.shape}")
+            self._cache_put(user_item_matrix, 'user_item_matrix', min_interactions)
             return user_item_matrix
 
         except Exception as e:
@@ -345,10 +523,14 @@ class DataProcessor:
                 logger.warning(f"None of the requested feature columns {feature_cols} found in DataFrame")
                 return pd.DataFrame()
             
-            anomaly_data = df[available_cols].copy()
-            
-            # Handle missing values
-            anomaly_data = anomaly_data.fillna(anomaly_data.mean())
+            # Handle missing values: column-mean impute on one float64 copy of the features
+            # (copied so the caller's frame is never written through a view)
+            values = df[available_cols].to_numpy(dtype=np.float64, copy=True)
+            missing_rows, missing_cols = np.where(np.isnan(values))
+            if missing_rows.size:
+                col_means = np.nanmean(values, axis=0)
+                values[missing_rows, missing_cols] = col_means[missing_cols]
+            anomaly_data = pd.DataFrame(values, index=df.index, columns=available_cols, copy=False)
             
             logger.info(f"Prepared anomaly detection data with shape: {anomaly_data.shape}")
             return anomaly_data
@@ -364,43 +546,42 @@ class DataProcessor:
         rather than just the most recent transactions.
         """
         try:
-            end_date = datetime.now()
+            end_date = self._get_run_ts()
             start_date = end_date - timedelta(days=days)
             
-            logger.info(f"Fetching distributed transaction data for forecasting from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')} (limit: {limit})")
-
-            # Get a random sample distributed across the date range to ensure we get data from multiple days
-            # This uses MongoDB's $sample to get a random distribution rather than just recent data
-            transactions_cursor = self._get_async_db().transactions.aggregate([
-                {"$match": {"transactionDate": {"$gte": start_date, "$lte": end_date}}},
-                {"$sample": {"size": limit}}  # Random sample instead of most recent
-            ])
-            transactions_list = await transactions_cursor.to_list(length=limit)
+            logger.info("Fetching distributed transaction data for forecasting from {:%Y-%m-%d} to {:%Y-%m-%d} (limit: {})", start_date, end_date, limit)
+
+            # Spread the sample across the date range with one small indexed range query per
+            # day bucket, run concurrently, instead of a $match + $sample random-cursor scan
+            per_day = max(1, limit // days)
+            transactions = self._get_async_db().transactions
+
+            async def fetch_day(d: int) -> list:
+                day_start = start_date + timedelta(days=d)
+                if d == days - 1:
+                    date_range = {"$gte": day_start, "$lte": end_date}
+                else:
+                    date_range = {"$gte": day_start, "$lt": day_start + timedelta(days=1)}
+                cursor = transactions.find(
+                    {"transactionDate": date_range}, _TXN_PROJECTION
+                ).limit(per_day)
+                return await cursor.to_list(length=per_day)
+
+            day_batches = await asyncio.gather(*(fetch_day(d) for d in range(days)))
+            transactions_list = [txn for batch in day_batches for txn in batch][:limit]
 
             if not transactions_list:
                 logger.warning(f"No transaction data found for the last {days} days for forecasting.")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(transactions_list)
-
-            # Ensure 'transactionDate' is datetime and then rename to 'timestamp'
-            df['transactionDate'] = pd.to_datetime(df['transactionDate'])
+            # Typed ingest: transactionDate arrives as datetime64 and totalPrice/quantity as numbers
+            df = _typed_transactions_frame(transactions_list, _TXN_RECORD_DTYPE)
             df = df.sort_values('transactionDate').reset_index(drop=True)
-            df.rename(columns={'transactionDate': 'timestamp'}, inplace=True)
 
             # IMPORTANT: Rename 'totalPrice' to 'totalAmount' for consistency with models
-            if 'totalPrice' in df.columns:
-                df.rename(columns={'totalPrice': 'totalAmount'}, inplace=True)
-                df['totalAmount'] = pd.to_numeric(df['totalAmount'], errors='coerce').fillna(0)
-            else:
-                logger.warning("Column 'totalPrice' not found in transactions data. Forecasting model may fail.")
-                df['totalAmount'] = 0.0
-
-            # Ensure 'quantity' is numeric
-            if 'quantity' in df.columns:
-                df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+            df.rename(columns={'transactionDate': 'timestamp', 'totalPrice': 'totalAmount'}, inplace=True)
 
-            unique_dates = df['timestamp'].dt.date.nunique()
+            unique_dates = _count_unique_days(df['timestamp'])
             logger.info(f"Fetched {len(df)} transactions for forecasting spanning {unique_dates} unique dates.")
             return df
 
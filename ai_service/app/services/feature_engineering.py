@@ -1,9 +1,216 @@
+import math
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from typing import Optional, List
+from sklearn.base import clone
 from sklearn.preprocessing import StandardScaler, MinMaxScaler, LabelEncoder
+from numpy.lib.stride_tricks import sliding_window_view
 from app.utils.logger import logger
 
+# Below this many columns the thread pool's fixed cost outweighs the win.
+_PARALLEL_MIN_COLUMNS = 4
+
+ANOMALY_WINDOW = 7
+
+_NS_PER_HOUR = 3_600_000_000_000
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+
+_ROLLING_REDUCERS = {
+    'mean': lambda windows: windows.mean(axis=1),
+    'std': lambda windows: (windows.std(axis=1, ddof=1) if windows.shape[1] > 1
+                            else np.full(len(windows), np.nan)),
+    'min': lambda windows: windows.min(axis=1),
+    'max': lambda windows: windows.max(axis=1),
+}
+
+
+def _iso_week(days: np.ndarray, day_of_week: np.ndarray) -> np.ndarray:
+    """
+    ISO-8601 week numbers from days since the epoch and Monday=0 weekdays.
+    An ISO week belongs to the year its Thursday falls in, and week 1 is
+    the week holding that year's first Thursday.
+    """
+    thursday = days - day_of_week + 3
+    year_start = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    return ((thursday - year_start) // 7 + 1).astype(np.int16)
+
+
+def _time_field(values: pd.Series, dtype, has_nans: bool) -> np.ndarray:
+    """
+    Narrows a datetime accessor field to `dtype`. NaT rows come back as NaN
+    (or <NA>), which an integer cast would silently turn into 0, so columns
+    with missing timestamps stay float32 with NaN instead.
+    """
+    if has_nans:
+        return values.to_numpy(dtype=np.float32, na_value=np.nan)
+    return values.to_numpy().astype(dtype)
+
+
+def _map_columns(func, cols: list) -> list:
+    """
+    Maps `func` over independent columns, on a thread pool when there are
+    enough of them (the numpy reductions and sorts release the GIL).
+    """
+    if len(cols) < _PARALLEL_MIN_COLUMNS:
+        return [func(col) for col in cols]
+    with ThreadPoolExecutor(max_workers=min(len(cols), os.cpu_count() or 1)) as executor:
+        return list(executor.map(func, cols))
+
+
+def _append_columns(df: pd.DataFrame, new_columns) -> pd.DataFrame:
+    """
+    Appends freshly computed features (a dict of arrays or a ready-made
+    DataFrame block) to `df` with a single concat, replacing same-named
+    columns from an earlier run.
+    """
+    if isinstance(new_columns, pd.DataFrame):
+        block = new_columns
+    else:
+        block = pd.DataFrame(new_columns, index=df.index, copy=False)
+    return pd.concat([df.drop(columns=block.columns, errors='ignore'), block], axis=1)
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Full-window rolling mean from prefix sums, O(n) regardless of window.
+    Values are centred first to limit cancellation in the running sum, and
+    windows containing NaN come back as NaN.
+    """
+    nan_mask = np.isnan(values)
+    centre = values[~nan_mask].mean() if not nan_mask.all() else 0.0
+    centred = np.where(nan_mask, 0.0, values - centre)
+    sums = np.concatenate(([0.0], np.cumsum(centred)))
+    means = (sums[window:] - sums[:-window]) / window + centre
+    if nan_mask.any():
+        nan_counts = np.concatenate(([0], np.cumsum(nan_mask)))
+        means[(nan_counts[window:] - nan_counts[:-window]) > 0] = np.nan
+    return means
+
+
+def _rolling_block(values: np.ndarray, window: int, agg_funcs: list) -> dict:
+    """
+    Computes several full-window rolling aggregates over one float64 array.
+    The mean uses prefix sums; the other aggregates share a single strided
+    window view. Rows without a complete window, and windows containing
+    NaN, come back as 0 (pandas' rolling() followed by fillna(0)).
+    """
+    n = len(values)
+    results = {}
+    if window > n or window < 1:
+        for agg_func in agg_funcs:
+            results[agg_func] = np.zeros(n)
+        return results
+
+    windows = None
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for agg_func in agg_funcs:
+            if agg_func == 'mean':
+                rolled = _rolling_mean(values, window)
+            else:
+                if windows is None:
+                    windows = sliding_window_view(values, window)
+                rolled = _ROLLING_REDUCERS[agg_func](windows)
+            rolled[np.isnan(rolled)] = 0.0
+            out = np.zeros(n)
+            out[window - 1:] = rolled
+            results[agg_func] = out
+    return results
+
+
+def _column_scaler(scaler, index: int):
+    """
+    Returns an unfitted clone of a multi-column scaler carrying only the
+    fitted statistics of column `index`.
+    """
+    column_scaler = clone(scaler)
+    n_features = scaler.n_features_in_
+    for attr, value in vars(scaler).items():
+        if not attr.endswith('_'):
+            continue
+        if isinstance(value, np.ndarray) and value.ndim == 1 and len(value) == n_features:
+            value = value[index:index + 1].copy()
+        setattr(column_scaler, attr, value)
+    column_scaler.n_features_in_ = 1
+    return column_scaler
+
+
+def _transform_in_place(scaler, values: np.ndarray) -> np.ndarray:
+    """
+    Applies a fitted StandardScaler/MinMaxScaler to a float64 array that the
+    caller owns, writing into it instead of letting sklearn allocate a copy.
+    """
+    if isinstance(scaler, StandardScaler):
+        if scaler.with_mean:
+            np.subtract(values, scaler.mean_, out=values)
+        if scaler.with_std:
+            np.divide(values, scaler.scale_, out=values)
+        return values
+    if isinstance(scaler, MinMaxScaler):
+        np.multiply(values, scaler.scale_, out=values)
+        np.add(values, scaler.min_, out=values)
+        if scaler.clip:
+            np.clip(values, scaler.feature_range[0], scaler.feature_range[1], out=values)
+        return values
+    return scaler.transform(values)
+
+
+def _trailing_window_stats(values: np.ndarray, window: int):
+    """
+    Trailing mean and sample std over up to `window` observations per row,
+    skipping NaN (rolling(window, min_periods=1) semantics). Windows whose
+    non-NaN values are all equal report a std of exactly 0.
+    """
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = sliding_window_view(padded, window)
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(windows, axis=1)
+        std = np.nanstd(windows, axis=1, ddof=1)
+        constant = np.nanmax(windows, axis=1) == np.nanmin(windows, axis=1)
+    std[constant & ~np.isnan(std)] = 0.0
+    return mean, std
+
+
+class RollingState:
+    """
+    Ring buffer of the last `window` observations of one series, so anomaly
+    features for a newly arrived value cost O(window) instead of rebuilding
+    the whole frame. Mirrors create_anomaly_features: NaN occupies a slot but
+    is skipped, std is the sample std, and missing results are reported as 0.
+    """
+    __slots__ = ('buf', 'head', 'window')
+
+    def __init__(self, window: int = ANOMALY_WINDOW):
+        self.window = window
+        self.buf = [math.nan] * window
+        self.head = 0
+
+    def update(self, value: float) -> tuple:
+        """
+        Pushes `value` and returns (mean, std, deviation, zscore) for it.
+        """
+        self.buf[self.head] = value
+        self.head = (self.head + 1) % self.window
+
+        observed = [v for v in self.buf if not math.isnan(v)]
+        if not observed:
+            return 0.0, 0.0, 0.0, 0.0
+        mean = sum(observed) / len(observed)
+        if len(observed) < 2:
+            std = 0.0
+        elif max(observed) == min(observed):
+            std = 0.0
+        else:
+            std = math.sqrt(sum((v - mean) ** 2 for v in observed) / (len(observed) - 1))
+        if math.isnan(value):
+            return mean, std, 0.0, 0.0
+        deviation = value - mean
+        return mean, std, deviation, deviation / (std if std != 0 else 1.0)
+
+
 class FeatureEngineer:
     """
     Handles feature engineering for machine learning models.
@@ -11,6 +218,7 @@ class FeatureEngineer:
     def __init__(self):
         self.scalers = {} # To store scalers for different features
         self.encoders = {} # To store encoders for categorical features
+        self.rolling_states = {} # Streaming anomaly-feature state per value column
 
     def create_time_features(self, df: pd.DataFrame, timestamp_col: str = 'timestamp') -> pd.DataFrame:
         """
@@ -21,17 +229,42 @@ class FeatureEngineer:
             logger.warning("DataFrame is empty or timestamp_col not found for time features.")
             return df
 
-        df['year'] = df[timestamp_col].dt.year
-        df['month'] = df[timestamp_col].dt.month
-        df['day'] = df[timestamp_col].dt.day
-        df['day_of_week'] = df[timestamp_col].dt.dayofweek
-        df['day_of_year'] = df[timestamp_col].dt.dayofyear
-        df['week_of_year'] = df[timestamp_col].dt.isocalendar().week.astype(int)
-        df['hour'] = df[timestamp_col].dt.hour
-        df['quarter'] = df[timestamp_col].dt.quarter
-        df['is_weekend'] = ((df[timestamp_col].dt.dayofweek == 5) | (df[timestamp_col].dt.dayofweek == 6)).astype(int)
-        df['is_month_start'] = df[timestamp_col].dt.is_month_start.astype(int)
-        df['is_month_end'] = df[timestamp_col].dt.is_month_end.astype(int)
+        ts = df[timestamp_col]
+        dt = ts.dt
+        has_nans = ts.hasnans
+        if ts.dtype == 'datetime64[ns]' and not has_nans:
+            # Clock-only fields straight from the int64 nanosecond buffer;
+            # the epoch (1970-01-01) was a Thursday, i.e. dayofweek 3.
+            ns = ts.to_numpy().view('i8')
+            days = ns // _NS_PER_DAY
+            day_of_week = ((days + 3) % 7).astype(np.int8)
+            hour = ((ns // _NS_PER_HOUR) % 24).astype(np.int8)
+            week_of_year = _iso_week(days, day_of_week)
+        else:
+            day_of_week = _time_field(dt.dayofweek, np.int8, has_nans)
+            hour = _time_field(dt.hour, np.int8, has_nans)
+            week_of_year = _time_field(dt.isocalendar().week, np.int16, has_nans)
+
+        # Narrow integer widths: every field fits in int8/int16, and the
+        # sklearn/xgboost estimators upcast to float at fit time anyway.
+        # Missing timestamps keep the fields float32 (NaN) instead.
+        # Month and day are read once and reused for quarter and the
+        # month-boundary flags instead of going back to the accessor.
+        month = _time_field(dt.month, np.int8, has_nans)
+        day = _time_field(dt.day, np.int8, has_nans)
+        df = df.assign(
+            year=_time_field(dt.year, np.int16, has_nans),
+            month=month,
+            day=day,
+            day_of_week=day_of_week,
+            day_of_year=_time_field(dt.dayofyear, np.int16, has_nans),
+            week_of_year=week_of_year,
+            hour=hour,
+            quarter=((month - 1) // 3 + 1).astype(month.dtype),
+            is_weekend=(day_of_week >= 5).astype(np.int8),
+            is_month_start=(day == 1).astype(np.int8),
+            is_month_end=(day == dt.days_in_month.to_numpy()).astype(np.int8),
+        )
 
         logger.info(f"Created time features for DataFrame with {len(df)} rows.")
         return df
@@ -48,10 +281,27 @@ class FeatureEngineer:
             logger.error(f"One or more columns {cols} not found for lag features.")
             return df
 
-        for col in cols:
-            for lag in lags:
-                df[f'{col}_lag_{lag}'] = df[col].shift(lag)
-        df = df.fillna(0) # Fill NaN from shifting
+        # Shift all requested columns at once into a preallocated zero block
+        # (zeros are the fill for the leading rows), keeping the col-major
+        # `{col}_lag_{lag}` ordering of the original per-column loop.
+        # Float32 (and small int) sources stay float32; everything else,
+        # including pandas extension dtypes, lags as float64.
+        source_dtypes = [dtype if isinstance(dtype, np.dtype) else np.dtype(np.float64) for dtype in df[cols].dtypes]
+        lag_dtype = np.promote_types(np.result_type(*source_dtypes), np.float32)
+        base = df[cols].to_numpy(dtype=lag_dtype, na_value=np.nan)
+        base = np.where(np.isnan(base), 0, base)
+        n_rows, n_lags = len(df), len(lags)
+        out = np.zeros((n_rows, len(cols) * n_lags), dtype=lag_dtype)
+        for j, lag in enumerate(lags):
+            block = out[:, j::n_lags]
+            if lag == 0:
+                block[:] = base
+            elif lag > 0:
+                block[lag:] = base[:-lag]
+            else:
+                block[:lag] = base[-lag:]
+        names = [f'{col}_lag_{lag}' for col in cols for lag in lags]
+        df = _append_columns(df, pd.DataFrame(out, columns=names, index=df.index))
         logger.info(f"Created lag features for columns {cols} with lags {lags}.")
         return df
 
@@ -67,18 +317,19 @@ class FeatureEngineer:
             logger.error(f"One or more columns {cols} not found for rolling features.")
             return df
 
-        for col in cols:
-            for window in windows:
-                for agg_func in agg_funcs:
-                    if agg_func == 'mean':
-                        df[f'{col}_roll_mean_{window}'] = df[col].rolling(window=window).mean()
-                    elif agg_func == 'std':
-                        df[f'{col}_roll_std_{window}'] = df[col].rolling(window=window).std()
-                    elif agg_func == 'min':
-                        df[f'{col}_roll_min_{window}'] = df[col].rolling(window=window).min()
-                    elif agg_func == 'max':
-                        df[f'{col}_roll_max_{window}'] = df[col].rolling(window=window).max()
-        df = df.fillna(0) # Fill NaN from rolling
+        funcs = [agg_func for agg_func in agg_funcs if agg_func in _ROLLING_REDUCERS]
+
+        def roll_column(col):
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            # One window view per (col, window), shared by every aggregate
+            return [_rolling_block(values, window, funcs) for window in windows]
+
+        new_columns = {}
+        for col, rolled_by_window in zip(cols, _map_columns(roll_column, cols)):
+            for window, rolled in zip(windows, rolled_by_window):
+                for agg_func in funcs:
+                    new_columns[f'{col}_roll_{agg_func}_{window}'] = rolled[agg_func]
+        df = _append_columns(df, new_columns)
         logger.info(f"Created rolling features for columns {cols} with windows {windows} and funcs {agg_funcs}.")
         return df
 
@@ -90,14 +341,45 @@ class FeatureEngineer:
             logger.warning("DataFrame is empty or value_col not found for anomaly features.")
             return df
 
-        df[f'{value_col}_daily_mean'] = df[value_col].rolling(window=7, min_periods=1).mean()
-        df[f'{value_col}_daily_std'] = df[value_col].rolling(window=7, min_periods=1).std()
-        df[f'{value_col}_deviation'] = df[value_col] - df[f'{value_col}_daily_mean']
-        df[f'{value_col}_zscore'] = df[f'{value_col}_deviation'] / df[f'{value_col}_daily_std'].replace(0, 1) # Avoid div by zero
-        df = df.fillna(0)
+        values = df[value_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        mean, std = _trailing_window_stats(values, ANOMALY_WINDOW)
+        deviation = values - mean
+        new_columns = {
+            f'{value_col}_daily_mean': mean,
+            f'{value_col}_daily_std': std,
+            f'{value_col}_deviation': deviation,
+            f'{value_col}_zscore': deviation / np.where(std == 0, 1.0, std), # Avoid div by zero
+        }
+        for feature in new_columns.values():
+            feature[np.isnan(feature)] = 0.0
+        df = _append_columns(df, new_columns)
         logger.info(f"Created anomaly features for '{value_col}'.")
         return df
 
+    def update_anomaly_features(self, value_col: str, value: float) -> dict:
+        """
+        Computes anomaly features for one newly arrived value in O(window)
+        (see RollingState), continuing the window of the previous values
+        pushed for `value_col`. The window starts empty on first use.
+        """
+        states = self._rolling_states()
+        state = states.get(value_col)
+        if state is None:
+            state = states[value_col] = RollingState(ANOMALY_WINDOW)
+        mean, std, deviation, zscore = state.update(float(value))
+        return {
+            f'{value_col}_daily_mean': mean,
+            f'{value_col}_daily_std': std,
+            f'{value_col}_deviation': deviation,
+            f'{value_col}_zscore': zscore,
+        }
+
+    def _rolling_states(self) -> dict:
+        # Feature engineers unpickled from before streaming support lack the attribute
+        if not hasattr(self, 'rolling_states'):
+            self.rolling_states = {}
+        return self.rolling_states
+
     def scale_features(self, df: pd.DataFrame, cols: list, scaler_type: str = 'StandardScaler', fit: bool = True) -> pd.DataFrame:
         """
         Scales numerical features.
@@ -110,23 +392,37 @@ class FeatureEngineer:
             logger.warning(f"DataFrame empty or columns missing for scaling: {cols}.")
             return df
 
+        if fit:
+            if scaler_type == 'StandardScaler':
+                scaler = StandardScaler()
+            elif scaler_type == 'MinMaxScaler':
+                scaler = MinMaxScaler()
+            else:
+                raise ValueError("scaler_type must be 'StandardScaler' or 'MinMaxScaler'")
+            # One fit over all columns; the per-column scalers mirror its
+            # statistics so lookups by a single column name keep working.
+            values = df[cols]
+            scaler.fit(values)
+            df[cols] = _transform_in_place(scaler, values.to_numpy(dtype=np.float64))
+            self.scalers[tuple(cols)] = scaler
+            for i, col in enumerate(cols):
+                self.scalers[col] = _column_scaler(scaler, i)
+            logger.info(f"Fitted and scaled {cols} with {scaler_type}.")
+            return df
+
+        batch_scaler = self.scalers.get(tuple(cols))
+        if batch_scaler is not None:
+            df[cols] = _transform_in_place(batch_scaler, df[cols].to_numpy(dtype=np.float64))
+            logger.info(f"Transformed {cols} with existing {scaler_type}.")
+            return df
+
         for col in cols:
-            if fit:
-                if scaler_type == 'StandardScaler':
-                    scaler = StandardScaler()
-                elif scaler_type == 'MinMaxScaler':
-                    scaler = MinMaxScaler()
-                else:
-                    raise ValueError("scaler_type must be 'StandardScaler' or 'MinMaxScaler'")
-                df[col] = scaler.fit_transform(df[[col]])
-                self.scalers[col] = scaler
-                logger.info(f"Fitted and scaled '{col}' with {scaler_type}.")
+            if col in self.scalers:
+                column = df[col].to_numpy(dtype=np.float64, copy=True).reshape(-1, 1)
+                df[col] = _transform_in_place(self.scalers[col], column)[:, 0]
+                logger.info(f"Transformed '{col}' with existing {scaler_type}.")
             else:
-                if col in self.scalers:
-                    df[col] = self.scalers[col].transform(df[[col]])
-                    logger.info(f"Transformed '{col}' with existing {scaler_type}.")
-                else:
-                    logger.warning(f"No scaler found for '{col}', skipping transformation.")
+                logger.warning(f"No scaler found for '{col}', skipping transformation.")
         return df
 
     def encode_categorical_features(self, df: pd.DataFrame, cols: list, encoder_type: str = 'LabelEncoder', fit: bool = True) -> pd.DataFrame:
@@ -141,27 +437,39 @@ class FeatureEngineer:
             logger.warning(f"DataFrame empty or columns missing for encoding: {cols}.")
             return df
 
+        if encoder_type == 'LabelEncoder' and fit:
+            # Hash-based codes against the sorted categories, i.e. the same
+            # integers LabelEncoder would assign; the fitted categories Index
+            # is stored in place of the encoder object.
+            def fit_column(col):
+                categorical = pd.Categorical(df[col].to_numpy())
+                return categorical.categories, categorical.codes.astype(np.int64)
+
+            for col, (categories, codes) in zip(cols, _map_columns(fit_column, cols)):
+                df[col] = codes
+                self.encoders[col] = categories
+                logger.info(f"Fitted and encoded '{col}' with LabelEncoder.")
+            return df
+
         for col in cols:
             if encoder_type == 'LabelEncoder':
-                if fit:
-                    encoder = LabelEncoder()
-                    df[col] = encoder.fit_transform(df[col])
-                    self.encoders[col] = encoder
-                    logger.info(f"Fitted and encoded '{col}' with LabelEncoder.")
+                if col in self.encoders:
+                    # Handle unseen labels during transformation
+                    # Replace unseen labels with a placeholder (e.g., -1) or the most frequent label
+                    # Here, we'll assign -1 for simplicity
+                    values = df[col].to_numpy()
+                    encoder = self.encoders[col]
+                    # Older pickles hold a fitted LabelEncoder rather than an Index
+                    categories = pd.Index(encoder.classes_) if isinstance(encoder, LabelEncoder) else encoder
+                    codes = categories.get_indexer(values)
+                    unseen_mask = codes == -1
+                    if unseen_mask.any():
+                        unseen_labels = set(pd.unique(values[unseen_mask]))
+                        logger.warning(f"Unseen labels detected in column '{col}': {unseen_labels}. Assigning -1.")
+                    df[col] = codes
+                    logger.info(f"Transformed '{col}' with existing LabelEncoder.")
                 else:
-                    if col in self.encoders:
-                        # Handle unseen labels during transformation
-                        # Replace unseen labels with a placeholder (e.g., -1) or the most frequent label
-                        # Here, we'll assign -1 for simplicity
-                        unseen_labels = set(df[col].unique()) - set(self.encoders[col].classes_)
-                        if unseen_labels:
-                            logger.warning(f"Unseen labels detected in column '{col}': {unseen_labels}. Assigning -1.")
-                            df[col] = df[col].apply(lambda x: self.encoders[col].transform([x])[0] if x in self.encoders[col].classes_ else -1)
-                        else:
-                            df[col] = self.encoders[col].transform(df[col])
-                        logger.info(f"Transformed '{col}' with existing LabelEncoder.")
-                    else:
-                        logger.warning(f"No encoder found for '{col}', skipping transformation.")
+                    logger.warning(f"No encoder found for '{col}', skipping transformation.")
             else:
                 raise ValueError("encoder_type must be 'LabelEncoder'")
         return df
@@ -2,52 +2,182 @@
 Performance tracking service for monitoring model performance improvements over time.
 """
 
+import contextlib
+import functools
 import json
 import os
+import tempfile
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from app.utils.logger import logger
 
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; history writes are then only serialized in-process
+    fcntl = None
+
 
 class ModelPerformanceTracker:
     """
     Tracks and compares model performance metrics over time to determine if retraining improves performance.
     """
+
+    # Records kept per model; the history file may grow to HISTORY_COMPACT_THRESHOLD
+    # lines before it is cut back, so appends rarely rewrite it
+    HISTORY_MAX_RECORDS = 50
+    HISTORY_COMPACT_THRESHOLD = 60
+    # Block size used when scanning a history file backwards for its last lines
+    TAIL_BLOCK_SIZE = 8192
     
     def __init__(self, storage_dir: str = "models/performance_history"):
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
+        # model_name -> lines in its history file, counted once and then tracked on append
+        self._history_line_counts: Dict[str, int] = {}
+        # Serializes history file writes within the process (see _history_lock)
+        self._history_mutex = threading.Lock()
         
-        # Define what constitutes improvement for each metric (higher_is_better)
-        self.metric_directions = {
-            # Forecasting metrics
-            'rmse': False,  # Lower RMSE is better
-            'r2_score': True,  # Higher R² is better
-            'mae': False,  # Lower MAE is better
-            'mape': False,  # Lower MAPE is better
-            
-            # Anomaly detection metrics
-            'outlier_percentage': None,  # Stable is better (depends on contamination setting)
-            'outliers_in_training_data': None,  # Depends on data quality
-            
-            # Dynamic pricing metrics
-            'mae': False,  # Lower MAE is better
-            
-            # Churn prediction metrics
-            'auc_score': True,  # Higher AUC is better
-            'accuracy': True,  # Higher accuracy is better
-            'precision': True,  # Higher precision is better
-            'recall': True,  # Higher recall is better
-            'f1-score': True,  # Higher F1 is better
-            
-            # Recommendation metrics (could be added)
-            'precision_at_k': True,  # Higher precision@k is better
-            'recall_at_k': True,  # Higher recall@k is better
-            'ndcg': True,  # Higher NDCG is better
+        # Define what constitutes improvement for each model's metrics (higher_is_better;
+        # None where the direction depends on the data)
+        self.metric_directions_by_model: Dict[str, Dict[str, Optional[bool]]] = {
+            'forecasting': {
+                'rmse': False,  # Lower RMSE is better
+                'r2_score': True,  # Higher R² is better
+                'mae': False,  # Lower MAE is better
+                'mape': False,  # Lower MAPE is better
+            },
+            'anomaly_detection': {
+                'outlier_percentage': None,  # Stable is better (depends on contamination setting)
+                'outliers_in_training_data': None,  # Depends on data quality
+            },
+            'pricing': {
+                'mae': False,  # Lower MAE is better
+            },
+            'churn': {
+                'auc_score': True,  # Higher AUC is better
+                'accuracy': True,  # Higher accuracy is better
+                'precision': True,  # Higher precision is better
+                'recall': True,  # Higher recall is better
+                'f1-score': True,  # Higher F1 is better
+            },
+            'recommendation': {
+                'precision_at_k': True,  # Higher precision@k is better
+                'recall_at_k': True,  # Higher recall@k is better
+                'ndcg': True,  # Higher NDCG is better
+            },
+        }
+        # Directions across all models, used for metrics (or models) without an entry of their own
+        self.metric_directions: Dict[str, Optional[bool]] = {}
+        for directions in self.metric_directions_by_model.values():
+            self.metric_directions.update(directions)
+
+        # model_name -> (metric index, higher_is_better, neutral) lookup tables; the arrays end
+        # with an entry for unlisted metrics (index -1), which are neutral
+        self._direction_tables: Dict[str, Tuple[Dict[str, int], np.ndarray, np.ndarray]] = {
+            model_name: self._build_direction_table(model_name) for model_name in self.metric_directions_by_model
         }
     
+    def _metric_directions_for(self, model_name: str) -> Dict[str, Optional[bool]]:
+        """Metric directions for a model: its own entries over the directions shared by all models."""
+        return {**self.metric_directions, **self.metric_directions_by_model.get(model_name, {})}
+
+    def _build_direction_table(self, model_name: str) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+        """Builds the (metric index, higher_is_better, neutral) lookup table of a model."""
+        directions = self._metric_directions_for(model_name)
+        return (
+            {metric_name: position for position, metric_name in enumerate(directions)},
+            np.array([direction is True for direction in directions.values()] + [False]),
+            np.array([direction is None for direction in directions.values()] + [True])
+        )
+
+    def _direction_arrays(self, model_name: str, metric_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the (higher_is_better, neutral) masks of a model's metrics, aligned with metric_names."""
+        if model_name not in self._direction_tables:
+            self._direction_tables[model_name] = self._build_direction_table(model_name)
+        index, higher_is_better, neutral = self._direction_tables[model_name]
+        positions = np.fromiter((index.get(name, -1) for name in metric_names), dtype=np.intp, count=len(metric_names))
+        return higher_is_better[positions], neutral[positions]
+
+    def _history_path(self, model_name: str) -> Path:
+        """
+        Path of the performance history file for a model: one compact JSON record per line,
+        oldest first. A legacy JSON-array history is converted on first access.
+        """
+        performance_file = self.storage_dir / f"{model_name}_performance_history.ndjson"
+        if not performance_file.exists():
+            legacy_file = self.storage_dir / f"{model_name}_performance_history.json"
+            if legacy_file.exists():
+                with self._history_lock(performance_file):
+                    # Another writer may have converted it while we waited
+                    if not performance_file.exists():
+                        self._convert_legacy_history(model_name, legacy_file, performance_file)
+        return performance_file
+
+    @contextlib.contextmanager
+    def _history_lock(self, performance_file: Path):
+        """
+        Holds the write lock of a history file: a thread lock within the process, plus flock
+        on a sidecar .lock file across processes sharing the storage directory. Compaction
+        reads the tail and then replaces the file, so an append landing in between would
+        otherwise be lost. Not reentrant.
+        """
+        with self._history_mutex:
+            if fcntl is None:
+                yield
+                return
+            with open(performance_file.with_suffix('.lock'), 'ab') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) # Released when the file is closed
+                yield
+
+    def _convert_legacy_history(self, model_name: str, legacy_file: Path, performance_file: Path) -> None:
+        """Writes the records of a JSON-array history file as a line-per-record history."""
+        try:
+            with open(legacy_file, 'r') as f:
+                history = json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Could not load existing performance history for {model_name}, starting fresh")
+            return
+        self._write_history_lines(
+            performance_file,
+            [json.dumps(record, separators=(',', ':')).encode() for record in history[-self.HISTORY_MAX_RECORDS:]]
+        )
+
+    @staticmethod
+    def _write_history_lines(performance_file: Path, lines: List[bytes]) -> None:
+        """Replaces a history file with the given lines through a uniquely named temporary file."""
+        tmp_file = tempfile.NamedTemporaryFile(
+            dir=performance_file.parent, prefix=f"{performance_file.name}.", suffix='.tmp', delete=False
+        )
+        try:
+            with tmp_file:
+                tmp_file.writelines(line + b'\n' for line in lines)
+            os.replace(tmp_file.name, performance_file)
+        finally:
+            if os.path.exists(tmp_file.name):
+                os.remove(tmp_file.name)
+
+    @classmethod
+    def _read_last_lines(cls, performance_file: Path, count: int) -> List[bytes]:
+        """
+        Reads the last `count` non-empty lines of a history file, scanning TAIL_BLOCK_SIZE
+        blocks backwards from the end until enough complete lines have been read.
+        """
+        if count <= 0:
+            return []
+        with open(performance_file, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            data = b''
+            while position > 0 and data.count(b'\n') <= count:
+                read_size = min(cls.TAIL_BLOCK_SIZE, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+        return [line for line in data.splitlines() if line.strip()][-count:]
+
     def save_model_performance(self, model_name: str, metrics: Dict[str, Any], 
                              additional_info: Optional[Dict[str, Any]] = None) -> None:
         """
@@ -66,35 +196,42 @@ class ModelPerformanceTracker:
                 'additional_info': additional_info or {}
             }
             
-            # Save to JSON file for the specific model
-            performance_file = self.storage_dir / f"{model_name}_performance_history.json"
-            
-            # Load existing history
-            history = []
-            if performance_file.exists():
-                try:
-                    with open(performance_file, 'r') as f:
-                        history = json.load(f)
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not load existing performance history for {model_name}, starting fresh")
-                    history = []
-            
-            # Add new record
-            history.append(performance_record)
-            
-            # Keep only last 50 records to avoid file bloat
-            if len(history) > 50:
-                history = history[-50:]
-            
-            # Save updated history
-            with open(performance_file, 'w') as f:
-                json.dump(history, f, indent=2)
+            performance_file = self._history_path(model_name)
+            # The append and any compaction happen under the file's write lock, so the tail
+            # read for compaction always includes every record appended before the replace
+            with self._history_lock(performance_file):
+                # Append the new record as one line to the model's history file
+                with open(performance_file, 'ab') as f:
+                    f.write(json.dumps(performance_record, separators=(',', ':')).encode() + b'\n')
+
+                line_count = self._history_line_counts.get(model_name)
+                if line_count is None:
+                    with open(performance_file, 'rb') as f:
+                        line_count = f.read().count(b'\n')
+                else:
+                    line_count += 1
+
+                # Keep only the last HISTORY_MAX_RECORDS records to avoid file bloat, rewriting
+                # just that tail once the file has grown past the threshold
+                if line_count > self.HISTORY_COMPACT_THRESHOLD:
+                    self._write_history_lines(performance_file, self._read_last_lines(performance_file, self.HISTORY_MAX_RECORDS))
+                    line_count = self.HISTORY_MAX_RECORDS
+                self._history_line_counts[model_name] = line_count
                 
             logger.info(f"Performance metrics saved for {model_name}: {metrics}")
             
         except Exception as e:
             logger.error(f"Failed to save performance metrics for {model_name}: {str(e)}")
     
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def _load_history(cls, path: str, mtime_ns: int, size: int) -> Tuple[Dict[str, Any], ...]:
+        """
+        Parses the retained records of a history file, most recent first. Keyed on the file's
+        mtime and size, so any append or compaction makes the next call read the file again.
+        """
+        return tuple(json.loads(line) for line in reversed(cls._read_last_lines(Path(path), cls.HISTORY_MAX_RECORDS)))
+
     def get_model_performance_history(self, model_name: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Get performance history for a specific model.
@@ -104,19 +241,21 @@ class ModelPerformanceTracker:
             limit: Maximum number of recent records to return
             
         Returns:
-            List of performance records, most recent first
+            List of performance records, most recent first (shared with the history cache,
+            so they should not be modified)
         """
         try:
-            performance_file = self.storage_dir / f"{model_name}_performance_history.json"
+            performance_file = self._history_path(model_name)
             
-            if not performance_file.exists():
+            try:
+                stat = performance_file.stat()
+            except FileNotFoundError:
                 return []
             
-            with open(performance_file, 'r') as f:
-                history = json.load(f)
-            
-            # Return most recent records first
-            return history[-limit:][::-1]
+            # Comparison, logging and trend analysis of a training cycle all read the same
+            # unchanged file, so it is parsed once; most recent records first
+            history = self._load_history(str(performance_file), stat.st_mtime_ns, stat.st_size)
+            return list(history[:max(limit, 0)])
             
         except Exception as e:
             logger.error(f"Failed to load performance history for {model_name}: {str(e)}")
@@ -166,55 +305,40 @@ class ModelPerformanceTracker:
             improved_metrics = []
             degraded_metrics = []
             
-            # Compare each metric
-            for metric_name, current_value in current_metrics.items():
-                if metric_name not in previous_metrics:
-                    continue
-                    
-                previous_value = previous_metrics[metric_name]
-                
-                # Skip non-numeric metrics
-                if not isinstance(current_value, (int, float)) or not isinstance(previous_value, (int, float)):
-                    continue
-                
-                # Calculate percentage change
-                if previous_value != 0:
-                    pct_change = ((current_value - previous_value) / abs(previous_value)) * 100
-                else:
-                    pct_change = 0.0 if current_value == 0 else float('inf')
-                
-                metric_direction = self.metric_directions.get(metric_name)
-                
-                if metric_direction is None:
-                    # For metrics where direction is unclear, just record the change
-                    comparison_result['improvements'][metric_name] = {
-                        'current': current_value,
-                        'previous': previous_value,
-                        'change': current_value - previous_value,
-                        'pct_change': pct_change,
-                        'direction': 'neutral'
-                    }
-                elif (metric_direction and current_value > previous_value) or \
-                     (not metric_direction and current_value < previous_value):
-                    # Improvement
-                    comparison_result['improvements'][metric_name] = {
-                        'current': current_value,
-                        'previous': previous_value,
-                        'change': current_value - previous_value,
-                        'pct_change': pct_change,
-                        'direction': 'improved'
-                    }
-                    improved_metrics.append(f"{metric_name}: {pct_change:+.2f}%")
+            # Numeric metrics recorded for both runs, in the order of current_metrics
+            metric_names = [
+                metric_name for metric_name, current_value in current_metrics.items()
+                if metric_name in previous_metrics
+                and isinstance(current_value, (int, float)) and isinstance(previous_metrics[metric_name], (int, float))
+            ]
+            current = np.fromiter((current_metrics[name] for name in metric_names), dtype=np.float64, count=len(metric_names))
+            previous = np.fromiter((previous_metrics[name] for name in metric_names), dtype=np.float64, count=len(metric_names))
+            higher_is_better, neutral = self._direction_arrays(model_name, metric_names)
+
+            # Compare all metrics at once; metrics without a clear direction are only recorded
+            change = current - previous
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pct_change = np.where(previous != 0, change / np.abs(previous) * 100, np.where(current == 0, 0.0, np.inf))
+            improved = ~neutral & np.where(higher_is_better, current > previous, current < previous)
+            labels = np.where(neutral, 'neutral', np.where(improved, 'improved', 'degraded'))
+
+            for metric_name, metric_change, metric_pct_change, label in zip(
+                metric_names, change.tolist(), pct_change.tolist(), labels.tolist()
+            ):
+                comparison = {
+                    'current': current_metrics[metric_name],
+                    'previous': previous_metrics[metric_name],
+                    'change': metric_change,
+                    'pct_change': metric_pct_change,
+                    'direction': label
+                }
+                if label == 'degraded':
+                    comparison_result['degradations'][metric_name] = comparison
+                    degraded_metrics.append(f"{metric_name}: {metric_pct_change:+.2f}%")
                 else:
-                    # Degradation
-                    comparison_result['degradations'][metric_name] = {
-                        'current': current_value,
-                        'previous': previous_value,
-                        'change': current_value - previous_value,
-                        'pct_change': pct_change,
-                        'direction': 'degraded'
-                    }
-                    degraded_metrics.append(f"{metric_name}: {pct_change:+.2f}%")
+                    comparison_result['improvements'][metric_name] = comparison
+                    if label == 'improved':
+                        improved_metrics.append(f"{metric_name}: {metric_pct_change:+.2f}%")
             
             # Determine overall improvement
             # Consider it an improvement if more metrics improved than degraded, 
@@ -308,6 +432,7 @@ class ModelPerformanceTracker:
                         metrics_over_time[metric_name].append(value)
             
             # Analyze trends
+            metric_directions = self._metric_directions_for(model_name)
             trend_analysis = {
                 'trend_available': True,
                 'training_cycles': len(history),
@@ -325,7 +450,7 @@ class ModelPerformanceTracker:
                 avg_first = sum(first_third) / len(first_third)
                 avg_last = sum(last_third) / len(last_third)
                 
-                metric_direction = self.metric_directions.get(metric_name)
+                metric_direction = metric_directions.get(metric_name)
                 
                 if metric_direction is None:
                     trend_direction = 'stable'
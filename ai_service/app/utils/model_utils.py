@@ -6,6 +6,20 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+def dump_atomic(obj: Any, path: str, compress: Any = 3) -> None:
+    """
+    Persists obj with joblib to a temporary file next to path and renames it into place,
+    so a crash mid-write never leaves a truncated file behind. compress is passed on to
+    joblib.dump (zlib level 3 by default); joblib.load detects it when reading back.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        joblib.dump(obj, tmp_path, compress=compress)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 class ModelUtils:
     """
     Utility class for saving, loading, and managing machine learning models.
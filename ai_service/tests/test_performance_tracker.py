@@ -0,0 +1,82 @@
+import json
+import threading
+
+from app.services.performance_tracker import ModelPerformanceTracker
+
+
+def _history_lines(tracker, model_name):
+    return (tracker.storage_dir / f"{model_name}_performance_history.ndjson").read_bytes().splitlines()
+
+
+def test_history_is_compacted_past_threshold(tmp_path):
+    tracker = ModelPerformanceTracker(str(tmp_path))
+    for i in range(tracker.HISTORY_COMPACT_THRESHOLD):
+        tracker.save_model_performance('forecasting', {'rmse': float(i)})
+    assert len(_history_lines(tracker, 'forecasting')) == tracker.HISTORY_COMPACT_THRESHOLD
+
+    tracker.save_model_performance('forecasting', {'rmse': float(tracker.HISTORY_COMPACT_THRESHOLD)})
+    lines = _history_lines(tracker, 'forecasting')
+    assert len(lines) == tracker.HISTORY_MAX_RECORDS
+    assert [json.loads(line)['metrics']['rmse'] for line in lines] == [
+        float(i) for i in range(tracker.HISTORY_COMPACT_THRESHOLD + 1 - tracker.HISTORY_MAX_RECORDS,
+                                tracker.HISTORY_COMPACT_THRESHOLD + 1)
+    ]
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_history_longer_than_one_tail_block(tmp_path):
+    tracker = ModelPerformanceTracker(str(tmp_path))
+    padding = 'x' * 500
+    for i in range(55):
+        tracker.save_model_performance('churn', {'auc_score': float(i)}, {'notes': padding})
+    performance_file = tmp_path / 'churn_performance_history.ndjson'
+    assert performance_file.stat().st_size > 2 * tracker.TAIL_BLOCK_SIZE
+
+    history = tracker.get_model_performance_history('churn', limit=tracker.HISTORY_MAX_RECORDS)
+    assert [record['metrics']['auc_score'] for record in history] == [float(i) for i in range(54, 4, -1)]
+    assert [json.loads(line)['metrics']['auc_score'] for line in tracker._read_last_lines(performance_file, 3)] == [
+        52.0, 53.0, 54.0
+    ]
+
+
+def test_legacy_json_history_is_converted(tmp_path):
+    records = [
+        {'timestamp': f'2024-01-01T00:00:{i:02d}', 'model_name': 'pricing', 'metrics': {'mae': float(i)}, 'additional_info': {}}
+        for i in range(70)
+    ]
+    (tmp_path / 'pricing_performance_history.json').write_text(json.dumps(records, indent=2))
+    tracker = ModelPerformanceTracker(str(tmp_path))
+
+    history = tracker.get_model_performance_history('pricing', limit=100)
+    assert history == records[::-1][:tracker.HISTORY_MAX_RECORDS]
+    assert len(_history_lines(tracker, 'pricing')) == tracker.HISTORY_MAX_RECORDS
+
+    tracker.save_model_performance('pricing', {'mae': 70.0})
+    assert tracker.get_model_performance_history('pricing', limit=1)[0]['metrics'] == {'mae': 70.0}
+
+
+def test_save_during_compaction_is_not_lost(tmp_path, monkeypatch):
+    tracker = ModelPerformanceTracker(str(tmp_path))
+    for i in range(tracker.HISTORY_COMPACT_THRESHOLD):
+        tracker.save_model_performance('recommendation', {'ndcg': float(i)})
+
+    # Another writer saves right after compaction has read the tail it keeps
+    read_last_lines = ModelPerformanceTracker._read_last_lines
+    writers = []
+
+    def read_then_race(performance_file, count):
+        lines = read_last_lines(performance_file, count)
+        if not writers:
+            writer = threading.Thread(target=tracker.save_model_performance, args=('recommendation', {'ndcg': -1.0}))
+            writers.append(writer)
+            writer.start()
+            writer.join(timeout=0.2)
+        return lines
+
+    monkeypatch.setattr(tracker, '_read_last_lines', read_then_race)
+    tracker.save_model_performance('recommendation', {'ndcg': float(tracker.HISTORY_COMPACT_THRESHOLD)})
+    writers[0].join()
+
+    metrics = [json.loads(line)['metrics']['ndcg'] for line in _history_lines(tracker, 'recommendation')]
+    assert metrics[-2:] == [float(tracker.HISTORY_COMPACT_THRESHOLD), -1.0]
+    assert len(metrics) == tracker._history_line_counts['recommendation'] == tracker.HISTORY_MAX_RECORDS + 1